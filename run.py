@@ -2,7 +2,9 @@
 # /// script
 # requires-python = ">=3.11"
 # dependencies = [
-#   "python-telegram-bot==21.11",
+#   "python-telegram-bot[rate-limiter]==21.11",
+#   "uvloop; sys_platform != 'win32'",
+#   "orjson",
 # ]
 # ///
 
@@ -28,6 +30,13 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        uvloop.install()
+
     main(
         echo_local=bool(args.echo_local),
         log_path=Path(args.log).expanduser() if args.log else None,
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
 from collections.abc import Awaitable, Callable
 import contextlib
+import fcntl
 import json
 import os
 from pathlib import Path
 import re
 import shutil
+import signal
 import tempfile
 from dataclasses import dataclass
 from typing import Sequence
@@ -15,6 +18,41 @@ from typing import Sequence
 from .config import Settings
 
 
+_READ_CHUNK = 65536
+_PIPE_SIZE = 1 << 20
+_OAUTH_HOST = "accounts.google.com"
+_OAUTH_RE = re.compile(r"https://accounts\.google\.com/o/oauth2/[^\s\"']+")
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    # Agents run in their own session; take down anything they spawned too.
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+async def _open_pipe() -> tuple[asyncio.StreamReader, asyncio.ReadTransport, int]:
+    """
+    Returns (reader, its transport, child write fd). On Linux the kernel buffer is raised
+    to 1 MiB so bursty output wakes the reader less often. Caller closes the write fd
+    after spawn, and the transport if the spawn fails.
+    """
+
+    r, w = os.pipe()
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        with contextlib.suppress(OSError):
+            fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, _PIPE_SIZE)
+    reader = asyncio.StreamReader()
+    loop = asyncio.get_running_loop()
+    try:
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(r, "rb", buffering=0)
+        )
+    except BaseException:
+        os.close(w)
+        raise
+    return reader, transport, w
+
+
 @dataclass(frozen=True)
 class AgentReply:
     text: str
@@ -54,7 +92,8 @@ class ShellAgent(Agent):
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             cwd=str(self._cwd),
-            env=os.environ.copy(),
+            env=None,
+            start_new_session=True,
         )
 
         try:
@@ -65,11 +104,11 @@ class ShellAgent(Agent):
             else:
                 stdout_b, stderr_b = await proc.communicate(prompt.encode("utf-8"))
         except TimeoutError:
-            proc.kill()
+            _kill_group(proc)
             await proc.wait()
             raise
         except asyncio.CancelledError:
-            proc.kill()
+            _kill_group(proc)
             with contextlib.suppress(Exception):
                 await proc.wait()
             raise
@@ -83,6 +122,16 @@ class ShellAgent(Agent):
 class CodexExecAgent(Agent):
     def __init__(self, settings: Settings) -> None:
         self._settings = settings
+        self._codex_path = shutil.which("codex")
+        # Only the sandbox flags and the output path vary per turn.
+        self._workdir = str(settings.agent_workdir)
+        self._argv_head = ("exec", "--json", "--skip-git-repo-check", "--color", "never")
+        self._argv_tail = (
+            "-C",
+            self._workdir,
+            *(("-m", settings.codex_model) if settings.codex_model else ()),
+            *settings.codex_extra_args,
+        )
 
     async def ask(
         self,
@@ -92,49 +141,79 @@ class CodexExecAgent(Agent):
         sandbox: str | None = None,
         on_oauth_url: Callable[[str], Awaitable[None]] | None = None,
     ) -> AgentReply:
-        if not shutil.which("codex"):
-            raise FileNotFoundError("codex not found on PATH")
+        if self._codex_path is None:
+            # Re-check on miss so installing codex doesn't need a restart.
+            self._codex_path = shutil.which("codex")
+            if self._codex_path is None:
+                raise FileNotFoundError("codex not found on PATH")
 
         with tempfile.TemporaryDirectory(prefix="tg-courier-codex-") as td:
             out_path = Path(td) / "last_message.txt"
             effective_sandbox = (sandbox or self._settings.codex_sandbox).strip() or "workspace-write"
             cmd: list[str] = [
-                "codex",
-                "exec",
-                "--json",
-                "--skip-git-repo-check",
-                "--color",
-                "never",
+                self._codex_path,
+                *self._argv_head,
                 *(
-                    ["--dangerously-bypass-approvals-and-sandbox"]
+                    ("--dangerously-bypass-approvals-and-sandbox",)
                     if yolo
-                    else ["--sandbox", effective_sandbox]
+                    else ("--sandbox", effective_sandbox)
                 ),
                 "--output-last-message",
                 str(out_path),
-                "-C",
-                str(self._settings.agent_workdir),
+                *self._argv_tail,
             ]
 
-            if self._settings.codex_model:
-                cmd.extend(["-m", self._settings.codex_model])
-            cmd.extend(self._settings.codex_extra_args)
-
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=str(self._settings.agent_workdir),
-                env=os.environ.copy(),
-            )
+            # Without an OAuth callback nothing reads the JSONL stream live, so let the
+            # child write straight to files and read them once after exit.
+            need_oauth = on_oauth_url is not None
+            stdout_path = Path(td) / "stdout.jsonl"
+            stderr_path = Path(td) / "stderr.txt"
+            if need_oauth:
+                transports: list[asyncio.ReadTransport] = []
+                write_fds: list[int] = []
+                try:
+                    out_reader, out_t, out_w = await _open_pipe()
+                    transports.append(out_t)
+                    write_fds.append(out_w)
+                    err_reader, err_t, err_w = await _open_pipe()
+                    transports.append(err_t)
+                    write_fds.append(err_w)
+                    proc = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        stdin=asyncio.subprocess.PIPE,
+                        stdout=out_w,
+                        stderr=err_w,
+                        cwd=self._workdir,
+                        env=None,
+                        start_new_session=True,
+                    )
+                except BaseException:
+                    for t in transports:
+                        t.close()
+                    raise
+                finally:
+                    for fd in write_fds:
+                        os.close(fd)
+            else:
+                with stdout_path.open("wb") as out_fh, stderr_path.open("wb") as err_fh:
+                    proc = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        stdin=asyncio.subprocess.PIPE,
+                        stdout=out_fh,
+                        stderr=err_fh,
+                        cwd=self._workdir,
+                        env=None,
+                        start_new_session=True,
+                    )
 
-            oauth_re = re.compile(r"https://accounts\\.google\\.com/o/oauth2/[^\s\"']+")
             seen_oauth: set[str] = set()
 
             async def handle_jsonl(line: str) -> None:
                 if not on_oauth_url:
                     return
+                # Cheap substring checks first; most lines never mention an OAuth host.
+                if not line.startswith("{") or _OAUTH_HOST not in line:
+                    return
                 try:
                     evt = json.loads(line)
                 except Exception:
@@ -151,7 +230,7 @@ class CodexExecAgent(Agent):
                         fields.append(v)
 
                 for blob in fields:
-                    for m in oauth_re.finditer(blob):
+                    for m in _OAUTH_RE.finditer(blob):
                         url = m.group(0)
                         if url in seen_oauth:
                             continue
@@ -161,30 +240,45 @@ class CodexExecAgent(Agent):
             stdout_parts: list[str] = []
             stderr_parts: list[str] = []
 
-            async def pump_stdout() -> None:
-                assert proc.stdout is not None
+            async def pump_stdout(reader: asyncio.StreamReader) -> None:
+                buf = bytearray()
                 while True:
-                    line_b = await proc.stdout.readline()
-                    if not line_b:
+                    chunk = await reader.read(_READ_CHUNK)
+                    if not chunk:
                         break
-                    line = line_b.decode("utf-8", errors="replace").rstrip("\n")
+                    buf.extend(chunk)
+                    start = 0
+                    while (nl := buf.find(b"\n", start)) >= 0:
+                        line = buf[start:nl].decode("utf-8", errors="replace")
+                        start = nl + 1
+                        stdout_parts.append(line + "\n")
+                        await handle_jsonl(line)
+                    del buf[:start]
+                if buf:
+                    line = buf.decode("utf-8", errors="replace")
                     stdout_parts.append(line + "\n")
                     await handle_jsonl(line)
 
-            async def pump_stderr() -> None:
-                assert proc.stderr is not None
+            async def pump_stderr(reader: asyncio.StreamReader) -> None:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
                 while True:
-                    line_b = await proc.stderr.readline()
-                    if not line_b:
+                    chunk = await reader.read(_READ_CHUNK)
+                    if not chunk:
                         break
-                    stderr_parts.append(line_b.decode("utf-8", errors="replace"))
-
-            proc.stdin.write(prompt.encode("utf-8"))
-            await proc.stdin.drain()
+                    stderr_parts.append(decoder.decode(chunk))
+                stderr_parts.append(decoder.decode(b"", final=True))
+
+            # Small prompts fit in the pipe buffer; close() flushes anything still queued.
+            data = prompt.encode("utf-8")
+            proc.stdin.write(data)
+            if len(data) > _READ_CHUNK:
+                await proc.stdin.drain()
             proc.stdin.close()
 
-            pump_out = asyncio.create_task(pump_stdout())
-            pump_err = asyncio.create_task(pump_stderr())
+            pumps: list[asyncio.Task] = []
+            if need_oauth:
+                pumps.append(asyncio.create_task(pump_stdout(out_reader)))
+                pumps.append(asyncio.create_task(pump_stderr(err_reader)))
 
             try:
                 if self._settings.agent_timeout_sec and self._settings.agent_timeout_sec > 0:
@@ -192,20 +286,24 @@ class CodexExecAgent(Agent):
                 else:
                     await proc.wait()
             except TimeoutError:
-                proc.kill()
+                _kill_group(proc)
                 await proc.wait()
                 raise
             except asyncio.CancelledError:
-                proc.kill()
+                _kill_group(proc)
                 with contextlib.suppress(Exception):
                     await proc.wait()
                 raise
             finally:
-                await pump_out
-                await pump_err
+                for t in pumps:
+                    await t
 
-            stdout = "".join(stdout_parts)
-            stderr = "".join(stderr_parts)
+            if need_oauth:
+                stdout = "".join(stdout_parts)
+                stderr = "".join(stderr_parts)
+            else:
+                stdout = stdout_path.read_bytes().decode("utf-8", errors="replace")
+                stderr = stderr_path.read_bytes().decode("utf-8", errors="replace")
             text = ""
             if out_path.exists():
                 text = out_path.read_text(encoding="utf-8", errors="replace").strip()
@@ -1,33 +1,61 @@
 from __future__ import annotations
 
+from collections.abc import Awaitable, Callable
+import functools
+
 from telegram import Update
+from telegram.ext import ContextTypes
 
 from .config import Settings
-from .state import StateStore
+from .ctx import HandlerCtx
+from .state import StateStore, StateStoreSqlite
 
 
-def resolve_allowed_user_id(settings: Settings, store: StateStore) -> int | None:
+def resolve_allowed_user_id(settings: Settings, store: StateStore | StateStoreSqlite) -> int | None:
     if settings.allowed_user_id is not None:
         return settings.allowed_user_id
     return store.get_claimed_user_id()
 
 
-def resolve_allowed_username(settings: Settings) -> str | None:
-    return settings.allowed_username.lower() if settings.allowed_username else None
-
-
-def is_allowed_user(settings: Settings, store: StateStore, update: Update) -> bool:
-    if not update.effective_user:
+def is_allowed_user(settings: Settings, store: StateStore | StateStoreSqlite, update: Update) -> bool:
+    user = update.effective_user
+    if user is None:
         return False
 
-    allowed_user_id = resolve_allowed_user_id(settings, store)
+    allowed_user_id = settings.allowed_user_id
+    if allowed_user_id is None:
+        allowed_user_id = store.get_claimed_user_id()
     if allowed_user_id is not None:
-        return update.effective_user.id == allowed_user_id
+        return user.id == allowed_user_id
 
-    allowed_username = resolve_allowed_username(settings)
-    if allowed_username:
-        username = (update.effective_user.username or "").strip().lower()
-        return bool(username) and username == allowed_username
+    # settings.allowed_username is already normalized (lowercase, no "@").
+    if settings.allowed_username:
+        username = user.username
+        return bool(username) and username.lower() == settings.allowed_username
 
     return False
 
+
+def accepts_private(update: Update, ctx: HandlerCtx) -> bool:
+    # Cheapest check first: most rejected updates come from groups.
+    chat = update.effective_chat
+    if chat is None or chat.type != "private":
+        return False
+    return is_allowed_user(ctx.settings, ctx.store, update)
+
+
+def require_allowed_private(
+    handler: Callable[[Update, ContextTypes.DEFAULT_TYPE, HandlerCtx], Awaitable[None]],
+) -> Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]:
+    """
+    Run the handler only for the allowed user in a private chat, passing it the HandlerCtx.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        ctx: HandlerCtx = context.bot_data["ctx"]
+        if not accepts_private(update, ctx):
+            return
+        await handler(update, context, ctx)
+
+    return wrapper
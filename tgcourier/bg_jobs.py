@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+from collections import OrderedDict
 import contextlib
+from itertools import islice
 import os
+import shlex
 import signal
 import time
 from dataclasses import dataclass
@@ -12,6 +15,11 @@ from datetime import timedelta
 from .tg_text import send_chat
 
 
+def _now_ms() -> int:
+    # Monotonic: job timestamps are only used for elapsed time, never displayed as dates.
+    return time.monotonic_ns() // 1_000_000
+
+
 @dataclass
 class BgJob:
     job_id: int
@@ -21,27 +29,63 @@ class BgJob:
     cwd: Path
     created_ms: int
     log_path: Path
+    # Display form of cmd, built once in start().
+    cmd_str: str = ""
 
     proc: asyncio.subprocess.Process | None = None
     pid: int | None = None
     started_ms: int | None = None
     ended_ms: int | None = None
     exit_code: int | None = None
-    status_message_id: int | None = None
+    # In-memory copy of the last log bytes; only kept while status pings are on.
+    tail_buf: bytearray | None = None
 
 
-def _tail_text(path: Path, *, max_chars: int = 2600) -> str:
-    if not path.exists():
-        return ""
+_STATUS_TAIL_BYTES = 8192
+_READ_CHUNK = 65536
+# After the child exits, how long the tee may keep draining before the job is reported done.
+_TEE_DRAIN_SEC = 1.0
+# Reported exit code when the command could not be started at all (as a shell would).
+_SPAWN_FAILED_RC = 127
+
+
+def tail_text(path: Path, *, max_chars: int = 2600) -> str:
+    # Read only the end of the file; 4 bytes/char covers any UTF-8 sequence.
     try:
-        data = path.read_text(encoding="utf-8", errors="replace")
+        with path.open("rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(0, size - max_chars * 4)
+            f.seek(start)
+            data = f.read().decode("utf-8", errors="replace")
     except Exception:
         return ""
+    if start == 0 and len(data) <= max_chars:
+        return data
+    return "…\n" + data[-max_chars:]
+
+
+def _buf_tail_text(buf: bytearray, *, max_chars: int) -> str:
+    data = buf.decode("utf-8", errors="replace")
     if len(data) <= max_chars:
         return data
     return "…\n" + data[-max_chars:]
 
 
+async def _tee_to_log(stream: asyncio.StreamReader, fd: int, buf: bytearray) -> None:
+    # Owns fd: closes it at EOF, which may come after the job itself has ended.
+    try:
+        while True:
+            chunk = await stream.read(_READ_CHUNK)
+            if not chunk:
+                return
+            os.write(fd, chunk)
+            buf.extend(chunk)
+            if len(buf) > _STATUS_TAIL_BYTES:
+                del buf[: len(buf) - _STATUS_TAIL_BYTES]
+    finally:
+        os.close(fd)
+
+
 class BgJobManager:
     def __init__(self, *, bot, base_dir: Path, logger, heartbeat_sec: int = 180) -> None:
         self._bot = bot
@@ -50,20 +94,31 @@ class BgJobManager:
         self._lock = asyncio.Lock()
         self._next_id = 1
         self._jobs: dict[int, BgJob] = {}
-        self._by_chat: dict[int, list[int]] = {}
+        # Per chat: all job ids in launch order, plus the still-running subset
+        # (dicts as ordered sets so both stay sorted by job id).
+        self._by_chat: dict[int, OrderedDict[int, None]] = {}
+        self._active_by_chat: dict[int, dict[int, None]] = {}
+        self._status_tasks: dict[int, asyncio.Task] = {}
+        # Tee pumps still draining output from children that outlived their job.
+        self._pumps: set[asyncio.Task] = set()
 
         self._dir = base_dir / "data" / "bg-jobs"
         self._dir.mkdir(parents=True, exist_ok=True)
 
     def _fmt_elapsed(self, *, started_ms: int | None) -> str:
-        if not started_ms:
+        if started_ms is None:
             return "0s"
-        sec = max(0, int((time.time() * 1000 - started_ms) / 1000))
+        # Whole minutes: status edits are skipped when the text is unchanged, and
+        # second-level drift alone shouldn't force one.
+        sec = max(0, (_now_ms() - started_ms) // 60_000 * 60)
         return str(timedelta(seconds=sec))
 
     def _status_text(self, job: BgJob) -> str:
         elapsed = self._fmt_elapsed(started_ms=job.started_ms)
-        tail = _tail_text(job.log_path, max_chars=1200).strip()
+        if job.tail_buf is not None:
+            tail = _buf_tail_text(job.tail_buf, max_chars=1200).strip()
+        else:
+            tail = tail_text(job.log_path, max_chars=1200).strip()
         lines = [
             f"BG job #{job.job_id} running",
             job.title,
@@ -78,42 +133,51 @@ class BgJobManager:
         text = "\n".join(lines).strip()
         return text[:3900] if len(text) > 3900 else text
 
-    async def _ensure_status_message(self, job: BgJob) -> None:
-        if self._heartbeat_sec <= 0:
-            return
-        if job.status_message_id is not None:
-            return
-        try:
-            msg = await self._bot.send_message(
-                chat_id=job.chat_id,
-                text=self._status_text(job),
-                disable_notification=True,
-                disable_web_page_preview=True,
-            )
-            job.status_message_id = getattr(msg, "message_id", None)
-        except Exception as e:
-            self._logger.info("bg status send failed job_id=%s err=%s", job.job_id, e)
+    def _chat_status_text(self, jobs: list[BgJob]) -> str:
+        text = "\n\n".join(self._status_text(j) for j in jobs)
+        return text[:3900] if len(text) > 3900 else text
 
-    async def _status_loop(self, job: BgJob) -> None:
-        if self._heartbeat_sec <= 0:
-            return
-        await self._ensure_status_message(job)
-        if job.status_message_id is None:
-            return
+    async def _chat_status_loop(self, chat_id: int) -> None:
+        """
+        One status message per chat covering every active job; deleted once none remain.
+        """
 
-        while True:
-            await asyncio.sleep(self._heartbeat_sec)
-            if job.ended_ms is not None:
-                return
-            try:
-                await self._bot.edit_message_text(
-                    chat_id=job.chat_id,
-                    message_id=job.status_message_id,
-                    text=self._status_text(job),
-                    disable_web_page_preview=True,
-                )
-            except Exception as e:
-                self._logger.info("bg status edit failed job_id=%s err=%s", job.job_id, e)
+        message_id: int | None = None
+        last_text: str | None = None
+        try:
+            while True:
+                active = self.active_for_chat(chat_id)
+                if not active:
+                    return
+                # Bounded tail reads of each job's log; off the loop all the same.
+                text = await asyncio.to_thread(self._chat_status_text, active)
+                try:
+                    if message_id is None:
+                        msg = await self._bot.send_message(
+                            chat_id=chat_id,
+                            text=text,
+                            disable_notification=True,
+                            disable_web_page_preview=True,
+                        )
+                        message_id = getattr(msg, "message_id", None)
+                        last_text = text
+                    elif text != last_text:
+                        await self._bot.edit_message_text(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            text=text,
+                            disable_web_page_preview=True,
+                        )
+                        last_text = text
+                except Exception as e:
+                    self._logger.info("bg status send/edit failed chat_id=%s err=%s", chat_id, e)
+                await asyncio.sleep(self._heartbeat_sec)
+        finally:
+            if self._status_tasks.get(chat_id) is asyncio.current_task():
+                del self._status_tasks[chat_id]
+            if message_id is not None:
+                with contextlib.suppress(Exception):
+                    await self._bot.delete_message(chat_id=chat_id, message_id=message_id)
 
     async def start(
         self,
@@ -132,35 +196,33 @@ class BgJobManager:
                 chat_id=chat_id,
                 title=title.strip() or "(background job)",
                 cmd=list(cmd),
+                cmd_str=shlex.join(cmd),
                 cwd=cwd,
-                created_ms=int(time.time() * 1000),
+                created_ms=_now_ms(),
                 log_path=log_path,
             )
             self._jobs[job_id] = job
-            self._by_chat.setdefault(chat_id, []).append(job_id)
+            self._by_chat.setdefault(chat_id, OrderedDict())[job_id] = None
+            self._active_by_chat.setdefault(chat_id, {})[job_id] = None
 
         asyncio.create_task(self._run(job))
+        if self._heartbeat_sec > 0:
+            task = self._status_tasks.get(chat_id)
+            if task is None or task.done():
+                self._status_tasks[chat_id] = asyncio.create_task(self._chat_status_loop(chat_id))
         return job
 
     def active_for_chat(self, chat_id: int) -> list[BgJob]:
-        ids = self._by_chat.get(chat_id, [])
-        jobs = [self._jobs[i] for i in ids if i in self._jobs]
-        active: list[BgJob] = []
-        for j in jobs:
-            if j.ended_ms is not None:
-                continue
-            active.append(j)
-        active.sort(key=lambda j: j.job_id)
-        return active
+        return [self._jobs[i] for i in self._active_by_chat.get(chat_id, ())]
 
+    # Readers don't take the lock: _jobs/_by_chat entries are only ever added (never
+    # removed), and completion updates the BgJob in place.
     async def list_for_chat(self, chat_id: int, *, limit: int = 20) -> list[BgJob]:
-        async with self._lock:
-            ids = list(reversed(self._by_chat.get(chat_id, [])))[: max(1, int(limit))]
-            return [self._jobs[i] for i in ids if i in self._jobs]
+        ids = islice(reversed(self._by_chat.get(chat_id, OrderedDict())), max(1, int(limit)))
+        return [self._jobs[i] for i in ids if i in self._jobs]
 
     async def get(self, job_id: int) -> BgJob | None:
-        async with self._lock:
-            return self._jobs.get(int(job_id))
+        return self._jobs.get(int(job_id))
 
     async def cancel(self, job_id: int) -> bool:
         job = await self.get(job_id)
@@ -170,8 +232,9 @@ class BgJobManager:
         if not proc or proc.returncode is not None:
             return False
 
+        # Jobs run in their own session (pgid == pid), so signal the whole group.
         try:
-            proc.send_signal(signal.SIGTERM)
+            os.killpg(proc.pid, signal.SIGTERM)
         except ProcessLookupError:
             return False
 
@@ -179,21 +242,22 @@ class BgJobManager:
             await asyncio.sleep(10)
             if proc.returncode is None:
                 with contextlib.suppress(Exception):
-                    proc.kill()
+                    os.killpg(proc.pid, signal.SIGKILL)
 
         asyncio.create_task(hard_kill())
         return True
 
     async def _run(self, job: BgJob) -> None:
-        job.started_ms = int(time.time() * 1000)
-        env = os.environ.copy()
+        job.started_ms = _now_ms()
 
         job.log_path.parent.mkdir(parents=True, exist_ok=True)
-        job.log_path.write_text("", encoding="utf-8")
 
-        status_task: asyncio.Task | None = None
-        if self._heartbeat_sec > 0:
-            status_task = asyncio.create_task(self._status_loop(job))
+        # Status pings need the log tail every few minutes: tee output through a pipe into
+        # an in-memory buffer. Otherwise hand the log fd straight to the child.
+        tee = self._heartbeat_sec > 0
+        header = f"$ {job.cmd_str}\n".encode("utf-8")
+        if tee:
+            job.tail_buf = bytearray(header)
 
         self._logger.info(
             "bg start job_id=%s chat_id=%s cwd=%s cmd=%s",
@@ -203,31 +267,66 @@ class BgJobManager:
             job.cmd,
         )
 
-        with job.log_path.open("a", encoding="utf-8") as fh:
-            fh.write(f"$ {' '.join(job.cmd)}\n")
-            fh.flush()
+        fd: int | None = None
+        pump: asyncio.Task | None = None
+        try:
+            fd = os.open(job.log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+            os.write(fd, header)
 
             proc = await asyncio.create_subprocess_exec(
                 *job.cmd,
                 cwd=str(job.cwd),
-                env=env,
-                stdout=fh,
-                stderr=fh,
+                env=None,
+                start_new_session=True,
+                stdout=asyncio.subprocess.PIPE if tee else fd,
+                stderr=asyncio.subprocess.STDOUT if tee else fd,
             )
+        except OSError as e:
+            # Missing binary, bad cwd, unwritable log dir: finish the job like any other
+            # failed run so it doesn't sit in the active list forever.
+            self._logger.warning("bg spawn failed job_id=%s chat_id=%s: %s", job.job_id, job.chat_id, e)
+            if fd is not None:
+                with contextlib.suppress(OSError):
+                    os.write(fd, f"error: {e}\n".encode("utf-8"))
+                os.close(fd)
+            job.exit_code = _SPAWN_FAILED_RC
+            job.ended_ms = _now_ms()
+            self._active_by_chat.get(job.chat_id, {}).pop(job.job_id, None)
+        else:
             job.proc = proc
             job.pid = proc.pid
-
-            rc = await proc.wait()
-            job.exit_code = int(rc) if rc is not None else None
-            job.ended_ms = int(time.time() * 1000)
-
-        if status_task:
-            status_task.cancel()
-            with contextlib.suppress(asyncio.CancelledError):
-                await status_task
-        if job.status_message_id is not None:
-            with contextlib.suppress(Exception):
-                await self._bot.delete_message(chat_id=job.chat_id, message_id=job.status_message_id)
+            try:
+                if tee:
+                    assert proc.stdout is not None and job.tail_buf is not None
+                    pump = asyncio.create_task(_tee_to_log(proc.stdout, fd, job.tail_buf))
+
+                # The job ends when the child exits, not at pipe EOF: a grandchild it
+                # backgrounded may hold stdout open for much longer.
+                rc = await proc.wait()
+                job.exit_code = int(rc) if rc is not None else None
+                job.ended_ms = _now_ms()
+                self._active_by_chat.get(job.chat_id, {}).pop(job.job_id, None)
+            finally:
+                if pump is None:
+                    os.close(fd)
+
+        if pump is not None:
+            # Let buffered output land in the log, then leave any stragglers to the pump,
+            # which keeps appending to the log and closes it at EOF.
+            await asyncio.wait({pump}, timeout=_TEE_DRAIN_SEC)
+            if not pump.done():
+                self._pumps.add(pump)
+                pump.add_done_callback(self._pumps.discard)
+        job.tail_buf = None
+
+        # Last active job in the chat: drop the shared status message now rather than
+        # at the next tick. Unregister first so a job started meanwhile gets a new loop.
+        if not self._active_by_chat.get(job.chat_id):
+            status_task = self._status_tasks.pop(job.chat_id, None)
+            if status_task:
+                status_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await status_task
 
         self._logger.info(
             "bg done job_id=%s chat_id=%s rc=%s",
@@ -236,7 +335,7 @@ class BgJobManager:
             job.exit_code,
         )
 
-        tail = _tail_text(job.log_path)
+        tail = tail_text(job.log_path)
         msg = f"Background job #{job.job_id} finished (exit={job.exit_code}).\n{job.title}\nLog: {job.log_path}"
         if tail.strip():
             msg += "\n\nTail:\n```" + "\n" + tail.strip() + "\n```"
@@ -1,23 +1,31 @@
 from __future__ import annotations
 
+import functools
 import os
+import re
 import shlex
 from dataclasses import dataclass
 from pathlib import Path
 
 
+# KEY=value lines; comments, blanks, and lines without `=` simply don't match.
+_ENV_RE = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=(.*)$", re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_dotenv(path: str, mtime_ns: int) -> tuple[tuple[str, str], ...]:
+    text = Path(path).read_text(encoding="utf-8")
+    return tuple(
+        (m.group(1), m.group(2).strip().strip("'").strip('"')) for m in _ENV_RE.finditer(text)
+    )
+
+
 def load_dotenv(dotenv_path: Path) -> None:
-    if not dotenv_path.exists():
+    try:
+        st = dotenv_path.stat()
+    except FileNotFoundError:
         return
-    for raw_line in dotenv_path.read_text(encoding="utf-8").splitlines():
-        line = raw_line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip().strip("'").strip('"')
+    for key, value in _parse_dotenv(str(dotenv_path.resolve()), st.st_mtime_ns):
         os.environ.setdefault(key, value)
 
 
@@ -58,6 +66,7 @@ class Settings:
     token: str
 
     allowed_user_id: int | None
+    # Normalized at load time (lowercase, no "@"); the auth gate compares against it as-is.
     allowed_username: str | None
     claim_code: str | None
 
@@ -70,6 +79,7 @@ class Settings:
     agent_timeout_sec: int  # 0 => no timeout
 
     heartbeat_sec: int
+    text_batch_ms: int  # 0 => dispatch every text immediately
 
     bg_heartbeat_sec: int
 
@@ -124,7 +134,7 @@ def load_settings(base_dir: Path) -> Settings:
             "Set TELEGRAM_ALLOWED_USER_ID, or set TELEGRAM_CLAIM_CODE for /claim onboarding"
         )
 
-    state_path = Path(_get_str("STATE_PATH", str(base_dir / "data" / "state.json"))).expanduser()
+    state_path = Path(_get_str("STATE_PATH", str(base_dir / "data" / "state.db"))).expanduser()
     max_turns = int(_get_str("MAX_TURNS", "20"))
 
     agent = (_get_str("AGENT", "codex") or "codex").lower()
@@ -133,6 +143,7 @@ def load_settings(base_dir: Path) -> Settings:
 
     heartbeat_sec = int(_get_str("HEARTBEAT_SEC", "45"))
     bg_heartbeat_sec = int(_get_str("BG_HEARTBEAT_SEC", "180"))
+    text_batch_ms = int(_get_str("TEXT_BATCH_MS", "800"))
 
     inbox_dir = Path(_get_str("INBOX_DIR", str(base_dir / "data" / "inbox"))).expanduser()
 
@@ -174,6 +185,7 @@ def load_settings(base_dir: Path) -> Settings:
         agent_workdir=agent_workdir,
         agent_timeout_sec=agent_timeout_sec,
         heartbeat_sec=heartbeat_sec,
+        text_batch_ms=text_batch_ms,
         bg_heartbeat_sec=bg_heartbeat_sec,
         inbox_dir=inbox_dir,
         memory_dir=memory_dir,
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+
+from .bg_jobs import BgJobManager
+from .config import Settings
+from .memory import MemoryStore
+from .msg_batcher import MessageBatcher
+from .queue import QueueManager
+from .state import StateStore, StateStoreSqlite
+
+
+@dataclass(slots=True, frozen=True)
+class HandlerCtx:
+    """
+    Everything handlers need, built once in main() and stored as bot_data["ctx"].
+    """
+
+    settings: Settings
+    store: StateStore | StateStoreSqlite
+    qm: QueueManager
+    bg: BgJobManager
+    memory: MemoryStore
+    logger: logging.Logger
+    batcher: MessageBatcher
@@ -1,24 +1,17 @@
 from __future__ import annotations
 
-import asyncio
-import logging
-
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from .auth import is_allowed_user, resolve_allowed_user_id, resolve_allowed_username
-from .config import Settings
-from .memory import MemoryStore
-from .queue import QueueManager
-from .state import StateStore
+from .auth import accepts_private, require_allowed_private, resolve_allowed_user_id
+from .ctx import HandlerCtx
 from .tg_reply import send_update_with_actions
 
 
-async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
+_AUDIO_EXTS = frozenset({"mp3", "m4a", "wav", "ogg", "opus", "flac"})
 
-    lines = [
+_HELP_TEXT = "\n".join(
+    (
         "tg-courier commands:",
         "/help",
         "/whoami",
@@ -39,10 +32,40 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "/sandbox_ro (codex) sandbox=read-only",
         "/mem <text> append daily",
         "/mem_rebuild rebuild backlinks",
-    ]
-    if settings.claim_code and resolve_allowed_user_id(settings, store) is None:
-        lines.append("(claim enabled: you must /claim first)")
-    await send_update_with_actions(update, context, "\n".join(lines))
+    )
+)
+
+
+_STATUS_TEMPLATE = "\n".join(
+    (
+        "agent: {agent}",
+        "workdir: {workdir}",
+        "state: {state}",
+        "allowed_user_id: {allowed_user_id}",
+        "allowed_username: @{allowed_username}",
+        "codex_sandbox: {codex_sandbox}",
+        "codex_yolo: {codex_yolo}",
+        "heartbeat_sec: {heartbeat_sec}",
+        "bg_heartbeat_sec: {bg_heartbeat_sec}",
+        "inbox_dir: {inbox_dir}",
+        "memory_dir: {memory_dir}",
+        "memory_enabled: {memory_enabled}",
+        "stt_enabled: {stt_enabled}",
+        "stt_model: {stt_model}",
+        "oauth_auto_peekaboo: {oauth_auto_peekaboo}",
+        "oauth_auto_allow: {oauth_auto_allow}",
+        "oauth_browser_app: {oauth_browser_app}",
+    )
+)
+
+
+async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    ctx: HandlerCtx = context.bot_data["ctx"]
+
+    text = _HELP_TEXT
+    if ctx.settings.claim_code and resolve_allowed_user_id(ctx.settings, ctx.store) is None:
+        text += "\n(claim enabled: you must /claim first)"
+    await send_update_with_actions(update, context, text)
 
 
 async def cmd_whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -51,73 +74,69 @@ async def cmd_whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     await send_update_with_actions(
         update,
         context,
-        "\n".join(
-            [
-                f"user_id: {user.id if user else 'unknown'}",
-                f"username: @{user.username if user and user.username else 'none'}",
-                f"chat_id: {chat.id if chat else 'unknown'}",
-                f"chat_type: {chat.type if chat else 'unknown'}",
-            ]
-        ),
+        f"user_id: {user.id if user else 'unknown'}\n"
+        f"username: @{user.username if user and user.username else 'none'}\n"
+        f"chat_id: {chat.id if chat else 'unknown'}\n"
+        f"chat_type: {chat.type if chat else 'unknown'}",
     )
 
 
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
-
-    async with state_lock:
-        codex_yolo = bool(
-            update.effective_chat and store.get_pref(update.effective_chat.id, "codex_yolo", False)
-        )
-        codex_sandbox_pref = (
-            store.get_pref(update.effective_chat.id, "codex_sandbox", None)
-            if update.effective_chat
-            else None
-        )
-        effective_sandbox = (
-            str(codex_sandbox_pref).strip()
-            if isinstance(codex_sandbox_pref, str) and str(codex_sandbox_pref).strip()
-            else settings.codex_sandbox
-        )
-
-    lines = [
-        f"agent: {settings.agent}",
-        f"workdir: {settings.agent_workdir}",
-        f"state: {store.path}",
-        f"allowed_user_id: {resolve_allowed_user_id(settings, store) or '(none)'}",
-        f"allowed_username: @{resolve_allowed_username(settings) or '(none)'}",
-        f"codex_sandbox: {effective_sandbox}",
-        f"codex_yolo: {codex_yolo}",
-        f"heartbeat_sec: {settings.heartbeat_sec}",
-        f"bg_heartbeat_sec: {settings.bg_heartbeat_sec}",
-        f"inbox_dir: {settings.inbox_dir}",
-        f"memory_dir: {settings.memory_dir}",
-        f"memory_enabled: {settings.memory_enabled}",
-        f"stt_enabled: {settings.stt_enabled}",
-        f"stt_model: {settings.stt_model}",
-        f"oauth_auto_peekaboo: {settings.oauth_auto_peekaboo}",
-        f"oauth_auto_allow: {settings.oauth_auto_allow}",
-        f"oauth_browser_app: {settings.oauth_browser_app}",
-    ]
-    await send_update_with_actions(update, context, "\n".join(lines))
+    ctx: HandlerCtx = context.bot_data["ctx"]
+
+    # get_pref is a plain read of the in-memory state with no await inside, so it
+    # can't observe a half-applied write; no need to queue behind the chat lock.
+    codex_yolo = bool(
+        update.effective_chat and ctx.store.get_pref(update.effective_chat.id, "codex_yolo", False)
+    )
+    codex_sandbox_pref = (
+        ctx.store.get_pref(update.effective_chat.id, "codex_sandbox", None)
+        if update.effective_chat
+        else None
+    )
+    effective_sandbox = (
+        str(codex_sandbox_pref).strip()
+        if isinstance(codex_sandbox_pref, str) and str(codex_sandbox_pref).strip()
+        else ctx.settings.codex_sandbox
+    )
+
+    settings = ctx.settings
+    text = _STATUS_TEMPLATE.format_map(
+        {
+            "agent": settings.agent,
+            "workdir": settings.agent_workdir,
+            "state": ctx.store.path,
+            "allowed_user_id": resolve_allowed_user_id(settings, ctx.store) or "(none)",
+            "allowed_username": settings.allowed_username or "(none)",
+            "codex_sandbox": effective_sandbox,
+            "codex_yolo": codex_yolo,
+            "heartbeat_sec": settings.heartbeat_sec,
+            "bg_heartbeat_sec": settings.bg_heartbeat_sec,
+            "inbox_dir": settings.inbox_dir,
+            "memory_dir": settings.memory_dir,
+            "memory_enabled": settings.memory_enabled,
+            "stt_enabled": settings.stt_enabled,
+            "stt_model": settings.stt_model,
+            "oauth_auto_peekaboo": settings.oauth_auto_peekaboo,
+            "oauth_auto_allow": settings.oauth_auto_allow,
+            "oauth_browser_app": settings.oauth_browser_app,
+        }
+    )
+    await send_update_with_actions(update, context, text)
 
 
 async def cmd_claim(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
+    ctx: HandlerCtx = context.bot_data["ctx"]
     args = context.args or []
 
-    if settings.allowed_user_id is not None or settings.allowed_username is not None:
+    if ctx.settings.allowed_user_id is not None or ctx.settings.allowed_username is not None:
         await send_update_with_actions(update, context, "Already locked via TELEGRAM_ALLOWED_USER_ID/USERNAME.")
         return
-    if not settings.claim_code:
+    if not ctx.settings.claim_code:
         await send_update_with_actions(update, context, "Claim disabled (missing TELEGRAM_CLAIM_CODE).")
         return
 
-    current = store.get_claimed_user_id()
+    current = ctx.store.get_claimed_user_id()
     if current is not None:
         await send_update_with_actions(update, context, f"Already claimed by user_id {current}.")
         return
@@ -126,7 +145,7 @@ async def cmd_claim(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send_update_with_actions(update, context, "Usage: /claim <code>")
         return
 
-    if args[0] != settings.claim_code:
+    if args[0] != ctx.settings.claim_code:
         await send_update_with_actions(update, context, "Bad claim code.")
         return
 
@@ -134,39 +153,21 @@ async def cmd_claim(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send_update_with_actions(update, context, "No user found on update.")
         return
 
-    async with state_lock:
-        store.set_claimed_user_id(update.effective_user.id)
+    ctx.store.set_claimed_user_id(update.effective_user.id)
     await send_update_with_actions(update, context, f"Claimed. allowed_user_id={update.effective_user.id}")
 
 
-async def cmd_reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat:
-        return
-
-    await qm.cancel_and_clear(update.effective_chat.id)
-    async with state_lock:
-        store.reset_chat(update.effective_chat.id)
+@require_allowed_private
+async def cmd_reset(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    await ctx.qm.cancel_and_clear(update.effective_chat.id)
+    async with ctx.store.chat_lock(update.effective_chat.id):
+        ctx.store.reset_chat(update.effective_chat.id)
     await send_update_with_actions(update, context, "Reset chat history (and canceled queue).")
 
 
-async def cmd_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat:
-        return
-
-    current, pending = await qm.snapshot(update.effective_chat.id)
+@require_allowed_private
+async def cmd_queue(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    current, pending = await ctx.qm.snapshot(update.effective_chat.id)
     if not current and not pending:
         await send_update_with_actions(update, context, "Queue empty.")
         return
@@ -185,117 +186,52 @@ async def cmd_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await send_update_with_actions(update, context, "\n".join(lines))
 
 
-async def cmd_drop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat:
-        return
-
-    n = await qm.drop_pending(update.effective_chat.id)
+@require_allowed_private
+async def cmd_drop(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    n = await ctx.qm.drop_pending(update.effective_chat.id)
     await send_update_with_actions(update, context, f"Dropped {n} pending job(s).")
 
 
-async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat:
-        return
-
-    await qm.cancel_and_clear(update.effective_chat.id)
+@require_allowed_private
+async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    await ctx.qm.cancel_and_clear(update.effective_chat.id)
     await send_update_with_actions(update, context, "Canceled current job and cleared queue.")
 
 
-async def cmd_w(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
+async def _set_codex_pref(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, value: object, reply: str
+) -> None:
+    ctx: HandlerCtx = context.bot_data["ctx"]
 
-    if not is_allowed_user(settings, store, update):
+    if not accepts_private(update, ctx):
         return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if settings.agent != "codex":
+    if ctx.settings.agent != "codex":
         await send_update_with_actions(update, context, "Not using Codex (AGENT!=codex).")
         return
 
-    async with state_lock:
-        store.set_pref(update.effective_chat.id, "codex_yolo", True)
-    await send_update_with_actions(update, context, "Codex yolo: ON")
+    await ctx.store.set_pref_atomic(update.effective_chat.id, key, value)
+    await send_update_with_actions(update, context, reply)
 
 
-async def cmd_ro(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
+async def cmd_w(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _set_codex_pref(update, context, "codex_yolo", True, "Codex yolo: ON")
 
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if settings.agent != "codex":
-        await send_update_with_actions(update, context, "Not using Codex (AGENT!=codex).")
-        return
 
-    async with state_lock:
-        store.set_pref(update.effective_chat.id, "codex_yolo", False)
-    await send_update_with_actions(update, context, "Codex yolo: OFF")
+async def cmd_ro(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _set_codex_pref(update, context, "codex_yolo", False, "Codex yolo: OFF")
 
 
 async def cmd_sandbox_rw(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if settings.agent != "codex":
-        await send_update_with_actions(update, context, "Not using Codex (AGENT!=codex).")
-        return
-
-    async with state_lock:
-        store.set_pref(update.effective_chat.id, "codex_sandbox", "workspace-write")
-    await send_update_with_actions(update, context, "Codex sandbox: workspace-write")
+    await _set_codex_pref(update, context, "codex_sandbox", "workspace-write", "Codex sandbox: workspace-write")
 
 
 async def cmd_sandbox_ro(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    state_lock: asyncio.Lock = context.bot_data["state_lock"]
+    await _set_codex_pref(update, context, "codex_sandbox", "read-only", "Codex sandbox: read-only")
 
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if settings.agent != "codex":
-        await send_update_with_actions(update, context, "Not using Codex (AGENT!=codex).")
-        return
-
-    async with state_lock:
-        store.set_pref(update.effective_chat.id, "codex_sandbox", "read-only")
-    await send_update_with_actions(update, context, "Codex sandbox: read-only")
-
-
-async def cmd_mem(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    mem: MemoryStore = context.bot_data["memory"]
-    logger: logging.Logger = context.bot_data["logger"]
 
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if not settings.memory_enabled:
+@require_allowed_private
+async def cmd_mem(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    if not ctx.settings.memory_enabled:
         await send_update_with_actions(update, context, "Memory disabled (MEMORY_ENABLED=0).")
         return
 
@@ -304,94 +240,89 @@ async def cmd_mem(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send_update_with_actions(update, context, "Usage: /mem <text> (appends to today’s note)")
         return
 
-    path = mem.append_daily(text)
-    logger.info("mem append path=%s", path)
+    path = await ctx.memory.append_daily(text)
+    ctx.logger.info("mem append path=%s", path)
     await send_update_with_actions(update, context, f"Saved to: {path}")
 
 
-async def cmd_mem_rebuild(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    mem: MemoryStore = context.bot_data["memory"]
-    logger: logging.Logger = context.bot_data["logger"]
-
-    if not is_allowed_user(settings, store, update):
-        return
-    if not update.effective_chat or update.effective_chat.type != "private":
-        return
-    if not settings.memory_enabled:
+@require_allowed_private
+async def cmd_mem_rebuild(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    if not ctx.settings.memory_enabled:
         await send_update_with_actions(update, context, "Memory disabled (MEMORY_ENABLED=0).")
         return
 
-    n = mem.rebuild_backlinks()
-    logger.info("mem rebuild updated=%s", n)
+    n = await ctx.memory.rebuild_backlinks(full=True)
+    ctx.logger.info("mem rebuild updated=%s", n)
     await send_update_with_actions(update, context, f"Backlinks rebuilt. Updated {n} files.")
 
 
+def _accepts_private_text(update: Update, ctx: HandlerCtx) -> tuple[int, str] | None:
+    message = update.message
+    if message is None or not accepts_private(update, ctx):
+        return None
+    text = (message.text or "").strip()
+    if not text:
+        return None
+    return message.chat_id, text
+
+
+def _ack(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    # Fire-and-forget so the handler returns as soon as the job is queued; PTB
+    # tracks the task and routes failures to the error handlers.
+    context.application.create_task(send_update_with_actions(update, context, text), update=update)
+
+
 async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-    logger: logging.Logger = context.bot_data["logger"]
+    ctx: HandlerCtx = context.bot_data["ctx"]
 
-    if not update.effective_user or not update.effective_chat or not update.message:
-        return
-    if update.effective_chat.type != "private":
-        return
-    if not is_allowed_user(settings, store, update):
+    accepted = _accepts_private_text(update, ctx)
+    if accepted is None:
         return
+    chat_id, text = accepted
 
-    text = (update.message.text or "").strip()
-    if not text:
-        return
+    ctx.logger.info("rx text chat_id=%s", chat_id)
+    ctx.batcher.add(update, context, chat_id, text)
 
-    logger.info("rx text chat_id=%s", update.effective_chat.id)
-    job_id, pos, started = await qm.enqueue_text(update.effective_chat.id, text)
-    if started and pos == 1:
-        await send_update_with_actions(update, context, f"Queued as #{job_id}. Starting now.")
-    else:
-        await send_update_with_actions(update, context, f"Queued as #{job_id} (position {pos}).")
 
+async def dispatch_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    """MessageBatcher callback: enqueue one (possibly merged) text as a single agent turn."""
+    ctx: HandlerCtx = context.bot_data["ctx"]
+    chat_id = update.effective_chat.id
+    job_id, pos, started = await ctx.qm.enqueue_text(chat_id, text)
+    ack = f"Queued as #{job_id}. Starting now." if started and pos == 1 else f"Queued as #{job_id} (position {pos})."
+    _ack(update, context, ack)
 
-async def on_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-    logger: logging.Logger = context.bot_data["logger"]
 
-    if not update.effective_user or not update.effective_chat or not update.message:
-        return
-    if update.effective_chat.type != "private":
-        return
-    if not is_allowed_user(settings, store, update):
+async def flush_text_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Runs ahead of commands and audio so texts sent just before them are queued first.
+    chat = update.effective_chat
+    if chat is not None:
+        await context.bot_data["ctx"].batcher.flush(chat.id)
+
+
+@require_allowed_private
+async def on_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    if not update.message:
         return
     if not update.message.voice:
         return
 
     file_id = update.message.voice.file_id
-    logger.info("rx voice chat_id=%s msg_id=%s", update.effective_chat.id, update.message.message_id)
-    job_id, pos, started = await qm.enqueue_audio(
+    ctx.logger.info("rx voice chat_id=%s msg_id=%s", update.effective_chat.id, update.message.message_id)
+    await flush_text_batch(update, context)
+    job_id, pos, started = await ctx.qm.enqueue_audio(
         chat_id=update.effective_chat.id,
         file_id=file_id,
         message_id=update.message.message_id,
         caption=update.message.caption,
     )
-    await send_update_with_actions(update, context, f"Queued voice as #{job_id} (position {pos}).")
+    _ack(update, context, f"Queued voice as #{job_id} (position {pos}).")
 
 
-async def on_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings: Settings = context.bot_data["settings"]
-    store: StateStore = context.bot_data["store"]
-    qm: QueueManager = context.bot_data["queue_manager"]
-    logger: logging.Logger = context.bot_data["logger"]
-
-    if not update.effective_user or not update.effective_chat or not update.message:
-        return
-    if update.effective_chat.type != "private":
+@require_allowed_private
+async def on_audio(update: Update, context: ContextTypes.DEFAULT_TYPE, ctx: HandlerCtx) -> None:
+    if not update.message:
         return
-    if not is_allowed_user(settings, store, update):
-        return
-
     file_id: str | None = None
     caption = update.message.caption
 
@@ -400,17 +331,18 @@ async def on_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     elif update.message.document:
         mime = (update.message.document.mime_type or "").lower()
         name = (update.message.document.file_name or "").lower()
-        if mime.startswith("audio/") or name.endswith((".mp3", ".m4a", ".wav", ".ogg", ".opus", ".flac")):
+        if mime.startswith("audio/") or ("." in name and name.rpartition(".")[2] in _AUDIO_EXTS):
             file_id = update.message.document.file_id
 
     if not file_id:
         return
 
-    logger.info("rx audio chat_id=%s msg_id=%s", update.effective_chat.id, update.message.message_id)
-    job_id, pos, started = await qm.enqueue_audio(
+    ctx.logger.info("rx audio chat_id=%s msg_id=%s", update.effective_chat.id, update.message.message_id)
+    await flush_text_batch(update, context)
+    job_id, pos, started = await ctx.qm.enqueue_audio(
         chat_id=update.effective_chat.id,
         file_id=file_id,
         message_id=update.message.message_id,
         caption=caption,
     )
-    await send_update_with_actions(update, context, f"Queued audio as #{job_id} (position {pos}).")
+    _ack(update, context, f"Queued audio as #{job_id} (position {pos}).")
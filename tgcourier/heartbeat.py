@@ -1,37 +1,90 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
+import contextlib
+from dataclasses import dataclass, field
 import time
 
 
 PING_TEXT = "working…"
+_PING_PREFIX = f"{PING_TEXT} (ping "
+
+_stamp_cache: tuple[int, str] = (-1, "")
+
+
+def _current_stamp() -> str:
+    # 10s buckets cap the edit rate at 6/min whatever the interval; localtime/strftime
+    # then run once per bucket rather than once per tick.
+    global _stamp_cache
+    bucket = int(time.time()) // 10 * 10
+    if bucket != _stamp_cache[0]:
+        _stamp_cache = (bucket, time.strftime("%H:%M:%S", time.localtime(bucket)))
+    return _stamp_cache[1]
 
 
 @dataclass
 class Heartbeat:
     message_id: int | None = None
+    last_text: str | None = None
+    started: float = field(default_factory=time.monotonic)
+    closed: bool = False
+
+
+class HeartbeatRegistry:
+    """One periodic task pings every chat with an agent run in flight."""
 
+    def __init__(self, *, bot, interval_sec: int, logger) -> None:
+        self._bot = bot
+        self._interval = max(5, int(interval_sec))
+        self._logger = logger
+        self.active: dict[int, Heartbeat] = {}
+        self._task: asyncio.Task | None = None
 
-async def heartbeat_loop(*, bot, chat_id: int, interval_sec: int, hb: Heartbeat, logger) -> None:
-    interval = max(5, int(interval_sec))
-    await asyncio.sleep(interval)
-    while True:
-        stamp = time.strftime("%H:%M:%S", time.localtime())
-        text = f"{PING_TEXT} (ping {stamp})"
+    def register(self, chat_id: int) -> Heartbeat:
+        hb = Heartbeat()
+        self.active[chat_id] = hb
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        return hb
+
+    async def unregister(self, chat_id: int, hb: Heartbeat) -> None:
+        hb.closed = True
+        if self.active.get(chat_id) is hb:
+            del self.active[chat_id]
+        if hb.message_id is not None:
+            with contextlib.suppress(Exception):
+                await self._bot.delete_message(chat_id=chat_id, message_id=hb.message_id)
+
+    async def _loop(self) -> None:
+        # Exits once nothing is registered; the next register() starts a fresh one.
+        while self.active:
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            due = [(cid, hb) for cid, hb in self.active.items() if now - hb.started >= self._interval]
+            if not due:
+                continue
+            text = _PING_PREFIX + _current_stamp() + ")"
+            await asyncio.gather(*(self._ping(cid, hb, text) for cid, hb in due), return_exceptions=True)
+
+    async def _ping(self, chat_id: int, hb: Heartbeat, text: str) -> None:
+        if text == hb.last_text:
+            return
         try:
             if hb.message_id is None:
-                msg = await bot.send_message(
+                msg = await self._bot.send_message(
                     chat_id=chat_id,
                     text=text,
                     disable_notification=True,
                     disable_web_page_preview=True,
                 )
                 hb.message_id = msg.message_id
+                if hb.closed:
+                    # The run finished while this send was in flight.
+                    await self._bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             else:
-                await bot.edit_message_text(chat_id=chat_id, message_id=hb.message_id, text=text)
+                await self._bot.edit_message_text(chat_id=chat_id, message_id=hb.message_id, text=text)
+            hb.last_text = text
         except Exception as e:
-            logger.info("heartbeat send/edit failed chat_id=%s err=%s", chat_id, e)
+            self._logger.info("heartbeat send/edit failed chat_id=%s err=%s", chat_id, e)
             hb.message_id = None
-        await asyncio.sleep(interval)
-
+            hb.last_text = None
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import heapq
+import os
 import re
+import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime
@@ -11,8 +16,32 @@ BACKLINKS_START = "<!-- tg-courier:backlinks:start -->"
 BACKLINKS_END = "<!-- tg-courier:backlinks:end -->"
 
 WIKILINK_RE = re.compile(r"\[\[([^\[\]#|]+?)(?:\|[^\]]+)?\]\]")
+_UNSAFE_PATH_CHARS_RE = re.compile(r"[<>\"\\\\|?*\u0000-\u001f]")
+_QUERY_TOKEN_RE = re.compile(r"[a-z0-9_-]{3,}")
+_STOPWORDS = frozenset({"the", "and", "for", "with"})
+_SCORE_CHUNK = 64
 
 
+@functools.lru_cache(maxsize=64)
+def _query_pattern(words: tuple[bytes, ...]) -> re.Pattern[bytes]:
+    # Longest first so a word that prefixes another doesn't shadow it.
+    return re.compile(b"|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@functools.lru_cache(maxsize=4096)
 def _safe_path_from_title(title: str) -> Path:
     raw = title.strip()
     if not raw:
@@ -21,7 +50,7 @@ def _safe_path_from_title(title: str) -> Path:
     parts = []
     for seg in raw.split("/"):
         seg = seg.strip().replace(":", "-")
-        seg = re.sub(r"[<>\"\\\\|?*\u0000-\u001f]", "", seg)
+        seg = _UNSAFE_PATH_CHARS_RE.sub("", seg)
         seg = seg.strip().strip(".")
         if not seg:
             continue
@@ -58,19 +87,87 @@ class MemoryStore:
     def __init__(self, cfg: MemoryConfig) -> None:
         self._cfg = cfg
         self._cfg.dir.mkdir(parents=True, exist_ok=True)
+        # (dir -> st_mtime_ns for every directory walked, sorted note paths)
+        self._notes_cache: tuple[dict[str, int], list[Path]] | None = None
+        # path -> (st_mtime_ns, st_size, body, raw bytes lowercased)
+        self._body_cache: dict[Path, tuple[int, int, str, bytes]] = {}
+        self._write_lock = threading.Lock()
+        # src -> (st_mtime_ns, st_size, resolved wikilink targets)
+        self._links: dict[Path, tuple[int, int, frozenset[Path]]] = {}
+        # target -> (st_mtime_ns, st_size, block) as of the last time the block was verified
+        self._block_cache: dict[Path, tuple[int, int, str]] = {}
 
     @property
     def dir(self) -> Path:
         return self._cfg.dir
 
     def _iter_notes(self) -> list[Path]:
-        return sorted(
-            p
-            for p in self._cfg.dir.rglob("*.md")
-            if p.is_file() and not p.name.startswith(".")
-        )
-
-    def append_daily(self, text: str, *, now: datetime | None = None) -> Path:
+        # Adding/removing/renaming an entry bumps its directory's mtime, so if no
+        # walked directory changed the previous listing is still exact.
+        cached = self._notes_cache
+        if cached is not None:
+            dirs, notes = cached
+            try:
+                if all(os.stat(d).st_mtime_ns == m for d, m in dirs.items()):
+                    return notes
+            except OSError:
+                pass
+
+        dirs = {}
+        notes = []
+        # Don't descend into symlinked directories: a link cycle would recurse forever.
+        for root, _dirnames, filenames in os.walk(self._cfg.dir):
+            dirs[root] = os.stat(root).st_mtime_ns
+            for name in filenames:
+                if name.endswith(".md") and not name.startswith("."):
+                    p = Path(root, name)
+                    if p.is_file():
+                        notes.append(p)
+        notes.sort()
+        self._notes_cache = (dirs, notes)
+        # list(dict) snapshots atomically; scoring threads may be filling these caches.
+        keep = set(notes)
+        for p in list(self._body_cache):
+            if p not in keep:
+                self._body_cache.pop(p, None)
+        for p in list(self._links):
+            if p not in keep:
+                self._links.pop(p, None)
+        return notes
+
+    def _get_body(self, path: Path) -> tuple[str, bytes]:
+        """
+        Return (body, ASCII-lowercased raw bytes), re-reading only when mtime or size changed.
+        """
+        st = path.stat()
+        hit = self._body_cache.get(path)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return hit[2], hit[3]
+        raw = path.read_bytes()
+        # Same newline handling as read_text().
+        body = raw.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        # Query tokens are [a-z0-9_-], so ASCII-only bytes.lower() is enough for scoring
+        # and much cheaper than str.lower().
+        body_l = raw.lower()
+        self._body_cache[path] = (st.st_mtime_ns, st.st_size, body, body_l)
+        return body, body_l
+
+    async def append_daily(self, text: str, *, now: datetime | None = None) -> Path:
+        return await asyncio.to_thread(self._locked, self._append_daily_sync, text, now=now)
+
+    async def rebuild_backlinks(self, *, full: bool = False) -> int:
+        """
+        Re-parse only notes that changed since the last call and rewrite only targets
+        whose backlinks block changed. full=True drops every cache first (repair path).
+        """
+        return await asyncio.to_thread(self._locked, self._rebuild_backlinks_sync, full=full)
+
+    def _locked(self, fn, /, *args, **kwargs):
+        # Note writes are read-modify-write; one writer thread at a time.
+        with self._write_lock:
+            return fn(*args, **kwargs)
+
+    def _append_daily_sync(self, text: str, *, now: datetime | None = None) -> Path:
         now = now or datetime.now()
         day_name = now.strftime("%Y-%m-%d")
         path = self._cfg.dir / f"{day_name}.md"
@@ -79,6 +176,9 @@ class MemoryStore:
 
         if not path.exists():
             path.write_text(f"# {day_name}\n\n{line}", encoding="utf-8")
+            # Don't rely on the dir mtime alone: coarse (1s) timestamps can hide a
+            # file created in the same tick as the last listing.
+            self._notes_cache = None
         else:
             existing = path.read_text(encoding="utf-8", errors="replace")
             if not existing.endswith("\n"):
@@ -86,31 +186,51 @@ class MemoryStore:
             path.write_text(existing + line, encoding="utf-8")
 
         if self._cfg.auto_rebuild:
-            self.rebuild_backlinks()
+            self._rebuild_backlinks_sync()
 
         return path
 
-    def rebuild_backlinks(self) -> int:
+    def _links_from(self, src: Path) -> frozenset[Path]:
+        st = src.stat()
+        hit = self._links.get(src)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return hit[2]
+        body, _ = self._get_body(src)
+        targets = set()
+        for m in WIKILINK_RE.finditer(body) if "[[" in body else ():
+            try:
+                target_rel = _safe_path_from_title(m.group(1))
+            except ValueError:
+                continue
+            targets.add((self._cfg.dir / target_rel).resolve())
+        links = frozenset(targets)
+        self._links[src] = (st.st_mtime_ns, st.st_size, links)
+        return links
+
+    def _rebuild_backlinks_sync(self, *, full: bool = False) -> int:
+        if full:
+            self._notes_cache = None
+            self._body_cache.clear()
+            self._links.clear()
+            self._block_cache.clear()
+
         notes = self._iter_notes()
         backlinks: dict[Path, set[Path]] = {}
 
         for src in notes:
-            body = src.read_text(encoding="utf-8", errors="replace")
-            for m in WIKILINK_RE.finditer(body):
-                title = m.group(1)
-                try:
-                    target_rel = _safe_path_from_title(title)
-                except ValueError:
-                    continue
-                target = (self._cfg.dir / target_rel).resolve()
-                backlinks.setdefault(target, set()).add(src.resolve())
-
-        updated = 0
+            links = self._links_from(src)
+            if links:
+                src_resolved = src.resolve()
+                for target in links:
+                    backlinks.setdefault(target, set()).add(src_resolved)
+
+        pending: list[tuple[Path, str, str]] = []
         for target, sources in backlinks.items():
             if not target.exists():
                 target.parent.mkdir(parents=True, exist_ok=True)
                 title = _title_from_path(target)
                 target.write_text(f"# {title}\n\n", encoding="utf-8")
+                self._notes_cache = None
 
             sources_sorted = sorted(sources, key=lambda p: p.as_posix().lower())
             block_lines = [
@@ -124,7 +244,12 @@ class MemoryStore:
             block_lines.append(BACKLINKS_END)
             block = "\n".join(block_lines).strip() + "\n"
 
-            content = target.read_text(encoding="utf-8", errors="replace")
+            # Same block and the file untouched since we last checked it: nothing to do.
+            st = target.stat()
+            if self._block_cache.get(target) == (st.st_mtime_ns, st.st_size, block):
+                continue
+
+            content, _ = self._get_body(target)
             if BACKLINKS_START in content and BACKLINKS_END in content:
                 pre, _mid = content.split(BACKLINKS_START, 1)
                 _old, post = _mid.split(BACKLINKS_END, 1)
@@ -133,14 +258,42 @@ class MemoryStore:
                 new_content = content.rstrip() + "\n\n" + block
 
             if new_content != content:
-                tmp = target.with_suffix(target.suffix + f".tmp.{int(time.time())}")
-                tmp.write_text(new_content, encoding="utf-8")
-                tmp.replace(target)
-                updated += 1
-
-        return updated
+                pending.append((target, new_content, block))
+            else:
+                self._block_cache[target] = (st.st_mtime_ns, st.st_size, block)
+
+        # Each target still goes tmp -> rename; the directory syncs are batched at the end.
+        stamp = int(time.time())
+        staged = []
+        for target, new_content, block in pending:
+            tmp = target.with_suffix(target.suffix + f".tmp.{stamp}")
+            tmp.write_text(new_content, encoding="utf-8")
+            staged.append((tmp, target, block))
+        for tmp, target, block in staged:
+            tmp.replace(target)
+            st = target.stat()
+            self._block_cache[target] = (st.st_mtime_ns, st.st_size, block)
+        for d in {target.parent for _tmp, target, _block in staged}:
+            _fsync_dir(d)
+
+        return len(staged)
+
+    def _score_notes(self, notes: list[Path], uniq: tuple[bytes, ...]) -> list[tuple[int, Path]]:
+        pat = _query_pattern(uniq)
+        scored: list[tuple[int, Path]] = []
+        for p in notes:
+            _, body_l = self._get_body(p)
+            # Most notes match nothing; the bytes substring search rejects them much
+            # faster than the regex engine would.
+            if not any(w in body_l for w in uniq):
+                continue
+            score = len(pat.findall(body_l))
+            if score <= 0:
+                continue
+            scored.append((score, p))
+        return scored
 
-    def build_context(self, query: str) -> str:
+    async def build_context(self, query: str) -> str:
         if not self._cfg.enabled:
             return ""
 
@@ -148,32 +301,33 @@ class MemoryStore:
         if not q:
             return ""
 
-        words = [w for w in re.findall(r"[a-z0-9_-]{3,}", q) if w not in {"the", "and", "for", "with"}]
+        words = [w for w in _QUERY_TOKEN_RE.findall(q) if w not in _STOPWORDS]
         if not words:
             return ""
 
-        scored: list[tuple[int, Path, str]] = []
-        for p in self._iter_notes():
-            body = p.read_text(encoding="utf-8", errors="replace")
-            body_l = body.lower()
-            score = sum(body_l.count(w) for w in words)
-            if score <= 0:
-                continue
-            snippet = body.strip().replace("\n", " ")
-            if len(snippet) > self._cfg.snippet_chars:
-                snippet = snippet[: self._cfg.snippet_chars] + "…"
-            scored.append((score, p, snippet))
+        uniq = tuple(w.encode() for w in dict.fromkeys(words))
+        # Score off the event loop, in chunks spread over the default thread pool so
+        # cold reads of different files overlap.
+        notes = await asyncio.to_thread(self._iter_notes)
+        chunks = [notes[i : i + _SCORE_CHUNK] for i in range(0, len(notes), _SCORE_CHUNK)]
+        results = await asyncio.gather(*(asyncio.to_thread(self._score_notes, c, uniq) for c in chunks))
+        scored = [t for r in results for t in r]
 
         if not scored:
             return ""
 
-        scored.sort(key=lambda t: (-t[0], t[1].as_posix().lower()))
-        top = scored[: max(1, self._cfg.max_snippets)]
+        top = heapq.nsmallest(
+            max(1, self._cfg.max_snippets), scored, key=lambda t: (-t[0], t[1].as_posix().lower())
+        )
 
         lines = ["Memory notes (local markdown):"]
-        for score, p, snippet in top:
+        for score, p in top:
+            # Snippets only for the winners; the bodies are still in the cache.
+            body, _ = self._get_body(p)
+            snippet = body.strip().replace("\n", " ")
+            if len(snippet) > self._cfg.snippet_chars:
+                snippet = snippet[: self._cfg.snippet_chars] + "…"
             rel = _relative_link(self._cfg.dir / "_.md", p)
             lines.append(f"- {p.stem} ({score} hits): {rel}")
             lines.append(f"  {snippet}")
         return "\n".join(lines).strip()
-
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+
+BatchKey = tuple[int, int | None]
+Dispatch = Callable[[Update, ContextTypes.DEFAULT_TYPE, str], Awaitable[None]]
+
+
+class MessageBatcher:
+    """
+    Coalesces rapid-fire texts per (chat_id, thread_id) into one dispatch.
+
+    Each new text restarts the idle window; when it elapses the texts are joined with
+    newlines and handed to `dispatch` along with the *last* message's update, so the
+    ack replies to the most recent message. A window of 0 dispatches every text as-is.
+    """
+
+    def __init__(self, *, window_sec: float, dispatch: Dispatch) -> None:
+        self._window = max(0.0, float(window_sec))
+        self._dispatch = dispatch
+        self._pending: dict[BatchKey, list[str]] = {}
+        self._last: dict[BatchKey, tuple[Update, ContextTypes.DEFAULT_TYPE]] = {}
+        self._timers: dict[BatchKey, asyncio.TimerHandle] = {}
+
+    def add(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str) -> None:
+        if self._window <= 0:
+            context.application.create_task(self._dispatch(update, context, text), update=update)
+            return
+
+        key = (chat_id, update.message.message_thread_id if update.message else None)
+        self._pending.setdefault(key, []).append(text)
+        self._last[key] = (update, context)
+
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(self._window, self._fire, key)
+
+    async def flush(self, chat_id: int) -> None:
+        """Dispatch any pending batch for chat_id now (e.g. before a command runs)."""
+        # Take every batch before awaiting any dispatch, so a timer firing in between
+        # can't claim a key this loop still expects to find.
+        batches = []
+        for key in [k for k in self._pending if k[0] == chat_id]:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            batches.append(self._take(key))
+        for update, context, text in batches:
+            await self._dispatch(update, context, text)
+
+    def drop_all(self) -> int:
+        """Cancel every idle timer and discard the pending batches (shutdown); returns how many."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        dropped = len(self._pending)
+        self._pending.clear()
+        self._last.clear()
+        return dropped
+
+    def _fire(self, key: BatchKey) -> None:
+        self._timers.pop(key, None)
+        if key not in self._pending:
+            return
+        update, context, text = self._take(key)
+        context.application.create_task(self._dispatch(update, context, text), update=update)
+
+    def _take(self, key: BatchKey) -> tuple[Update, ContextTypes.DEFAULT_TYPE, str]:
+        texts = self._pending.pop(key)
+        update, context = self._last.pop(key)
+        return update, context, "\n".join(texts)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+from collections import OrderedDict, deque
 import contextlib
 from dataclasses import dataclass
 from pathlib import Path
@@ -11,9 +12,9 @@ from telegram.error import TelegramError
 from .agent import Agent
 from .bg_jobs import BgJobManager
 from .config import Settings
-from .heartbeat import Heartbeat, heartbeat_loop
+from .heartbeat import HeartbeatRegistry
 from .memory import MemoryStore
-from .state import StateStore, render_prompt
+from .state import StateStore, StateStoreSqlite, render_prompt
 from .stt import TranscriptionError, cleanup_file, transcribe_file
 from .tool_directives import extract_detach_directive
 from .tg_actions import build_bg_job_actions
@@ -21,6 +22,9 @@ from .tg_oauth import oauth_peekaboo_flow
 from .tg_text import send_chat
 
 
+MAX_CHATS = 10_000
+
+
 @dataclass(frozen=True)
 class Job:
     job_id: int
@@ -36,20 +40,27 @@ class ChatQueue:
     def __init__(self) -> None:
         self.lock = asyncio.Lock()
         self.next_id = 1
-        self.queue: list[Job] = []
+        self.queue: deque[Job] = deque()
         self.current: Job | None = None
         self.worker_task: asyncio.Task | None = None
 
 
 class QueueManager:
+    """
+    Per-chat FIFO of agent turns, each drained by its own worker task.
+
+    Handlers only enqueue and return, so polling never waits on STT or the agent; jobs
+    run in order within a chat and concurrently across chats. A worker exits once its
+    queue is empty and the next enqueue starts a fresh one.
+    """
+
     def __init__(
         self,
         *,
         bot,
         agent: Agent,
         settings: Settings,
-        store: StateStore,
-        state_lock: asyncio.Lock,
+        store: StateStore | StateStoreSqlite,
         memory: MemoryStore,
         bg: BgJobManager,
         logger,
@@ -59,23 +70,41 @@ class QueueManager:
         self._agent = agent
         self._settings = settings
         self._store = store
-        self._state_lock = state_lock
         self._memory = memory
         self._bg = bg
         self._logger = logger
         self._system_prompt = system_prompt
         self._oauth_lock = asyncio.Lock()
-        self._chats: dict[int, ChatQueue] = {}
+        self._chats: OrderedDict[int, ChatQueue] = OrderedDict()
+        self._heartbeats = HeartbeatRegistry(bot=bot, interval_sec=settings.heartbeat_sec, logger=logger)
 
         self._settings.inbox_dir.mkdir(parents=True, exist_ok=True)
 
     def _get(self, chat_id: int) -> ChatQueue:
         cq = self._chats.get(chat_id)
-        if cq is None:
-            cq = ChatQueue()
-            self._chats[chat_id] = cq
+        if cq is not None:
+            self._chats.move_to_end(chat_id)
+            return cq
+        cq = ChatQueue()
+        self._chats[chat_id] = cq
+        if len(self._chats) > MAX_CHATS:
+            self._evict_idle()
         return cq
 
+    def _evict_idle(self) -> None:
+        # Oldest first; only queues with nothing running, pending or locked are dropped.
+        for cid in list(self._chats):
+            if len(self._chats) <= MAX_CHATS:
+                break
+            cq = self._chats[cid]
+            if (
+                not cq.queue
+                and cq.current is None
+                and (cq.worker_task is None or cq.worker_task.done())
+                and not cq.lock.locked()
+            ):
+                del self._chats[cid]
+
     async def enqueue_text(self, chat_id: int, text: str) -> tuple[int, int, bool]:
         cq = self._get(chat_id)
         async with cq.lock:
@@ -154,7 +183,7 @@ class QueueManager:
                 if not cq.queue:
                     cq.current = None
                     return
-                job = cq.queue.pop(0)
+                job = cq.queue.popleft()
                 cq.current = job
 
             await self._bot.send_message(
@@ -246,12 +275,12 @@ class QueueManager:
             preview = transcription if len(transcription) <= 1200 else transcription[:1200] + "…"
             await send_chat(self._bot, chat_id, f"Transcription (preview):\n{preview}", reply_markup=actions)
 
-        mem_ctx = self._memory.build_context(user_text) if settings.memory_enabled else ""
+        mem_ctx = await self._memory.build_context(user_text) if settings.memory_enabled else ""
         sys_prompt = self._system_prompt
         if mem_ctx:
             sys_prompt = sys_prompt.rstrip() + "\n\n" + mem_ctx
 
-        async with self._state_lock:
+        async with store.chat_lock(chat_id):
             prior = store.get_messages(chat_id, settings.max_turns)
             store.append(chat_id, "user", user_text)
             codex_yolo = bool(store.get_pref(chat_id, "codex_yolo", False))
@@ -260,21 +289,12 @@ class QueueManager:
 
         prompt = render_prompt(sys_prompt, prior, user_text)
 
-        hb = Heartbeat()
-        hb_task = asyncio.create_task(
-            heartbeat_loop(
-                bot=self._bot,
-                chat_id=chat_id,
-                interval_sec=settings.heartbeat_sec,
-                hb=hb,
-                logger=self._logger,
-            )
-        )
+        hb = self._heartbeats.register(chat_id)
 
         async def on_oauth_url(url: str) -> None:
             async with self._oauth_lock:
                 self._logger.info("oauth detected chat_id=%s url=%s", chat_id, url)
-                async with self._state_lock:
+                async with store.chat_lock(chat_id):
                     store.set_pref(chat_id, "pending_oauth_url", url)
 
                 await self._bot.send_message(
@@ -297,7 +317,9 @@ class QueueManager:
                 prompt,
                 yolo=codex_yolo,
                 sandbox=codex_sandbox,
-                on_oauth_url=on_oauth_url,
+                # Without Peekaboo automation there's nothing to drive, so let the agent
+                # skip live stdout scanning and write its output straight to files.
+                on_oauth_url=on_oauth_url if settings.oauth_auto_peekaboo else None,
             )
         except TimeoutError:
             await send_chat(
@@ -313,12 +335,7 @@ class QueueManager:
             await send_chat(self._bot, chat_id, f"Telegram error: {e}", reply_markup=actions)
             return
         finally:
-            hb_task.cancel()
-            with contextlib.suppress(asyncio.CancelledError):
-                await hb_task
-            if hb.message_id is not None:
-                with contextlib.suppress(Exception):
-                    await self._bot.delete_message(chat_id=chat_id, message_id=hb.message_id)
+            await self._heartbeats.unregister(chat_id, hb)
 
         detach_spec, cleaned = extract_detach_directive(reply.text)
         if detach_spec:
@@ -329,7 +346,7 @@ class QueueManager:
                 cmd = [str(x) for x in cmd_obj]
             else:
                 msg = "Bad DETACH directive: missing cmd (string or string list)."
-                async with self._state_lock:
+                async with store.chat_lock(chat_id):
                     store.append(chat_id, "assistant", msg)
                 await send_chat(self._bot, chat_id, msg)
                 return
@@ -347,7 +364,7 @@ class QueueManager:
             if cleaned:
                 msg = cleaned.strip() + "\n\n" + msg
 
-            async with self._state_lock:
+            async with store.chat_lock(chat_id):
                 store.append(chat_id, "assistant", msg)
             self._logger.info("tx(detach) chat_id=%s job_id=%s bg_job_id=%s", chat_id, job.job_id, bg_job.job_id)
             await send_chat(
@@ -358,7 +375,7 @@ class QueueManager:
             )
             return
 
-        async with self._state_lock:
+        async with store.chat_lock(chat_id):
             store.append(chat_id, "assistant", reply.text)
         self._logger.info("tx chat_id=%s job_id=%s chars=%s", chat_id, job.job_id, len(reply.text))
         await send_chat(self._bot, chat_id, reply.text, reply_markup=actions)
@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import io
 import json
+import os
+import sqlite3
+import threading
 import time
+import weakref
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -14,10 +20,42 @@ class ChatMessage:
     ts_ms: int
 
 
+_FLUSH_DELAY_SEC = 0.05
+_STAT_INTERVAL_SEC = 1.0
+# macOS has no fdatasync.
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def _encode(data: dict[str, Any], *, pretty: bool = False) -> bytes:
+    if pretty:
+        text = json.dumps(data, ensure_ascii=False, indent=2) + "\n"
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
 class StateStore:
     def __init__(self, path: Path) -> None:
         self._path = path
         self._path.parent.mkdir(parents=True, exist_ok=True)
+        # The document lives in memory; mutations mark it dirty and a short debounce
+        # coalesces bursts into a single file write.
+        self._doc: dict[str, Any] | None = None
+        self._doc_mtime_ns: int | None = None
+        self._stat_checked_at = 0.0
+        self._dirty = False
+        # Bumped per mutation; the write lock drops payloads older than the last one
+        # written, so an in-flight debounced write can't clobber a newer flush().
+        self._gen = 0
+        self._written_gen = 0
+        self._flush_task: asyncio.Task | None = None
+        self._write_lock = threading.Lock()
+        # Checked on every update by the auth gate; (re)set whenever the document is
+        # loaded, otherwise only /claim changes it.
+        self._claimed_user_id: int | None = None
+        self._data()
+        # Per-chat write locks; entries vanish once no coroutine holds or waits on them.
+        self._chat_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
 
     @property
     def path(self) -> Path:
@@ -33,23 +71,91 @@ class StateStore:
             self._path.replace(backup)
             return {"version": 1, "claimed_user_id": None, "chats": {}}
 
-    def save(self, data: dict[str, Any]) -> None:
-        tmp = self._path.with_suffix(self._path.suffix + ".tmp")
-        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
-        tmp.replace(self._path)
+    def save(self, data: dict[str, Any], *, pretty: bool = False) -> None:
+        self._write(_encode(data, pretty=pretty))
+
+    def _write(self, payload: bytes, gen: int | None = None) -> None:
+        # tmp + fdatasync + rename: a crash leaves either the old or the new file.
+        with self._write_lock:
+            if gen is not None:
+                if gen <= self._written_gen:
+                    return
+                self._written_gen = gen
+            tmp = self._path.with_suffix(self._path.suffix + ".tmp")
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                view = memoryview(payload)
+                while view:
+                    view = view[os.write(fd, view) :]
+                _fdatasync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, self._path)
+
+    def _file_mtime_ns(self) -> int | None:
+        try:
+            return self._path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _data(self) -> dict[str, Any]:
+        if self._doc is not None and not self._dirty:
+            # Pick up edits made to the file by something else, at most once a second.
+            now = time.monotonic()
+            if now - self._stat_checked_at >= _STAT_INTERVAL_SEC:
+                self._stat_checked_at = now
+                if self._file_mtime_ns() != self._doc_mtime_ns:
+                    self._doc = None
+        if self._doc is None:
+            self._doc = self.load()
+            self._doc_mtime_ns = self._file_mtime_ns()
+            v = self._doc.get("claimed_user_id")
+            self._claimed_user_id = int(v) if isinstance(v, int) else None
+        return self._doc
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        self._gen += 1
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, shutdown): write through.
+            self.flush()
+            return
+        self._flush_task = loop.create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        # Mutations during a write only set _dirty (this task is still running), so keep
+        # going until a write finishes with nothing new pending.
+        while True:
+            await asyncio.sleep(_FLUSH_DELAY_SEC)
+            if not self._dirty or self._doc is None:
+                return
+            # Serialize on the loop (the document isn't safe to read from another thread),
+            # then write and sync off it.
+            self._dirty = False
+            await asyncio.to_thread(self._write, _encode(self._doc), self._gen)
+            self._doc_mtime_ns = self._file_mtime_ns()
+
+    def flush(self) -> None:
+        if self._dirty and self._doc is not None:
+            self._dirty = False
+            self._write(_encode(self._doc), self._gen)
+            self._doc_mtime_ns = self._file_mtime_ns()
 
     def get_claimed_user_id(self) -> int | None:
-        data = self.load()
-        v = data.get("claimed_user_id")
-        return int(v) if isinstance(v, int) else None
+        return self._claimed_user_id
 
     def set_claimed_user_id(self, user_id: int) -> None:
-        data = self.load()
+        data = self._data()
         data["claimed_user_id"] = int(user_id)
-        self.save(data)
+        self._mark_dirty()
+        self._claimed_user_id = int(user_id)
 
     def reset_chat(self, chat_id: int) -> None:
-        data = self.load()
+        data = self._data()
         chats = data.setdefault("chats", {})
         chats[str(chat_id)] = {
             "created_at_ms": int(time.time() * 1000),
@@ -57,10 +163,10 @@ class StateStore:
             "messages": [],
             "prefs": {},
         }
-        self.save(data)
+        self._mark_dirty()
 
     def get_pref(self, chat_id: int, key: str, default: object | None = None) -> object | None:
-        data = self.load()
+        data = self._data()
         chat = (data.get("chats") or {}).get(str(chat_id)) or {}
         prefs = chat.get("prefs") or {}
         if not isinstance(prefs, dict):
@@ -68,7 +174,7 @@ class StateStore:
         return prefs.get(key, default)
 
     def set_pref(self, chat_id: int, key: str, value: object) -> None:
-        data = self.load()
+        data = self._data()
         chats = data.setdefault("chats", {})
         chat = chats.get(str(chat_id))
         if not chat:
@@ -86,10 +192,21 @@ class StateStore:
             chat["prefs"] = prefs
         prefs[key] = value
         chat["updated_at_ms"] = int(time.time() * 1000)
-        self.save(data)
+        self._mark_dirty()
+
+    def chat_lock(self, chat_id: int) -> asyncio.Lock:
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._chat_locks[chat_id] = lock
+        return lock
+
+    async def set_pref_atomic(self, chat_id: int, key: str, value: object) -> None:
+        async with self.chat_lock(chat_id):
+            self.set_pref(chat_id, key, value)
 
     def append(self, chat_id: int, role: str, text: str) -> None:
-        data = self.load()
+        data = self._data()
         chats = data.setdefault("chats", {})
         chat = chats.get(str(chat_id))
         if not chat:
@@ -105,10 +222,10 @@ class StateStore:
         chat.setdefault("messages", []).append(
             {"role": role, "text": text, "ts_ms": int(time.time() * 1000)}
         )
-        self.save(data)
+        self._mark_dirty()
 
     def get_messages(self, chat_id: int, max_turns: int) -> list[ChatMessage]:
-        data = self.load()
+        data = self._data()
         chat = (data.get("chats") or {}).get(str(chat_id)) or {}
         raw_messages = chat.get("messages") or []
         msgs = [
@@ -127,22 +244,196 @@ class StateStore:
         return msgs
 
 
+_SQLITE_SUFFIXES = frozenset({".db", ".sqlite", ".sqlite3"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY, created_ms INTEGER, updated_ms INTEGER);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    ts_ms INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, id);
+CREATE TABLE IF NOT EXISTS prefs (
+    chat_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value_json TEXT NOT NULL,
+    PRIMARY KEY (chat_id, key)
+);
+"""
+
+
+class StateStoreSqlite:
+    """
+    Same interface as StateStore, backed by SQLite in WAL mode: an append is one
+    INSERT instead of a rewrite of the whole history.
+    """
+
+    def __init__(self, path: Path, *, legacy_json: Path | None = None) -> None:
+        self._path = path
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+        if legacy_json is not None and legacy_json.exists() and self._is_empty():
+            self._import_json(legacy_json)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'claimed_user_id'").fetchone()
+        self._claimed_user_id: int | None = int(row[0]) if row and row[0] is not None else None
+        self._chat_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _is_empty(self) -> bool:
+        return (
+            self._db.execute("SELECT 1 FROM chats LIMIT 1").fetchone() is None
+            and self._db.execute("SELECT 1 FROM meta LIMIT 1").fetchone() is None
+        )
+
+    def _import_json(self, legacy_json: Path) -> None:
+        data = StateStore(legacy_json).load()
+        with self._db:
+            claimed = data.get("claimed_user_id")
+            if isinstance(claimed, int):
+                self._db.execute("INSERT INTO meta (key, value) VALUES ('claimed_user_id', ?)", (str(claimed),))
+            for cid, chat in (data.get("chats") or {}).items():
+                if not isinstance(chat, dict):
+                    continue
+                chat_id = int(cid)
+                self._db.execute(
+                    "INSERT INTO chats (chat_id, created_ms, updated_ms) VALUES (?, ?, ?)",
+                    (chat_id, int(chat.get("created_at_ms") or 0), int(chat.get("updated_at_ms") or 0)),
+                )
+                self._db.executemany(
+                    "INSERT INTO messages (chat_id, ts_ms, role, text) VALUES (?, ?, ?, ?)",
+                    (
+                        (chat_id, int(m.get("ts_ms") or 0), str(m.get("role") or ""), str(m.get("text") or ""))
+                        for m in chat.get("messages") or []
+                        if isinstance(m, dict)
+                    ),
+                )
+                prefs = chat.get("prefs")
+                if isinstance(prefs, dict):
+                    self._db.executemany(
+                        "INSERT INTO prefs (chat_id, key, value_json) VALUES (?, ?, ?)",
+                        ((chat_id, str(k), json.dumps(v)) for k, v in prefs.items()),
+                    )
+
+    def _touch_chat(self, chat_id: int, now_ms: int) -> None:
+        self._db.execute(
+            "INSERT INTO chats (chat_id, created_ms, updated_ms) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET updated_ms = excluded.updated_ms",
+            (chat_id, now_ms, now_ms),
+        )
+
+    def flush(self) -> None:
+        # Every write is committed as it happens; kept for interface parity with StateStore.
+        return
+
+    def get_claimed_user_id(self) -> int | None:
+        return self._claimed_user_id
+
+    def set_claimed_user_id(self, user_id: int) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES ('claimed_user_id', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (str(int(user_id)),),
+            )
+        self._claimed_user_id = int(user_id)
+
+    def reset_chat(self, chat_id: int) -> None:
+        now_ms = int(time.time() * 1000)
+        with self._db:
+            self._db.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._db.execute("DELETE FROM prefs WHERE chat_id = ?", (chat_id,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO chats (chat_id, created_ms, updated_ms) VALUES (?, ?, ?)",
+                (chat_id, now_ms, now_ms),
+            )
+
+    def get_pref(self, chat_id: int, key: str, default: object | None = None) -> object | None:
+        row = self._db.execute(
+            "SELECT value_json FROM prefs WHERE chat_id = ? AND key = ?", (chat_id, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_pref(self, chat_id: int, key: str, value: object) -> None:
+        with self._db:
+            self._touch_chat(chat_id, int(time.time() * 1000))
+            self._db.execute(
+                "INSERT INTO prefs (chat_id, key, value_json) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id, key) DO UPDATE SET value_json = excluded.value_json",
+                (chat_id, key, json.dumps(value)),
+            )
+
+    def chat_lock(self, chat_id: int) -> asyncio.Lock:
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._chat_locks[chat_id] = lock
+        return lock
+
+    async def set_pref_atomic(self, chat_id: int, key: str, value: object) -> None:
+        async with self.chat_lock(chat_id):
+            self.set_pref(chat_id, key, value)
+
+    def append(self, chat_id: int, role: str, text: str) -> None:
+        now_ms = int(time.time() * 1000)
+        with self._db:
+            self._touch_chat(chat_id, now_ms)
+            self._db.execute(
+                "INSERT INTO messages (chat_id, ts_ms, role, text) VALUES (?, ?, ?, ?)",
+                (chat_id, now_ms, role, text),
+            )
+
+    def get_messages(self, chat_id: int, max_turns: int) -> list[ChatMessage]:
+        keep = max(0, int(max_turns)) * 2
+        if keep:
+            rows = self._db.execute(
+                "SELECT role, text, ts_ms FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                (chat_id, keep),
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = self._db.execute(
+                "SELECT role, text, ts_ms FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [ChatMessage(role=r[0], text=r[1], ts_ms=r[2]) for r in rows]
+
+
+def open_state_store(path: Path) -> StateStore | StateStoreSqlite:
+    """
+    SQLite for .db/.sqlite/.sqlite3 paths (importing a sibling .json state on first
+    open), the JSON store otherwise.
+    """
+    if path.suffix in _SQLITE_SUFFIXES:
+        return StateStoreSqlite(path, legacy_json=path.with_suffix(".json"))
+    return StateStore(path)
+
+
 def render_prompt(system_prompt: str, messages: list[ChatMessage], user_text: str) -> str:
-    parts: list[str] = []
-    if system_prompt.strip():
-        parts.append(system_prompt.strip())
-        parts.append("")
+    buf = io.StringIO()
+    system_prompt = system_prompt.strip()
+    if system_prompt:
+        buf.write(system_prompt)
+        buf.write("\n\n")
 
     for m in messages:
         if m.role == "user":
-            parts.append(f"User: {m.text}".rstrip())
+            buf.write(f"User: {m.text}".rstrip())
         elif m.role == "assistant":
-            parts.append(f"Assistant: {m.text}".rstrip())
+            buf.write(f"Assistant: {m.text}".rstrip())
         else:
             continue
-        parts.append("")
+        buf.write("\n\n")
 
-    parts.append(f"User: {user_text}".rstrip())
-    parts.append("")
-    parts.append("Assistant:")
-    return "\n".join(parts).strip() + "\n"
+    buf.write(f"User: {user_text}".rstrip())
+    buf.write("\n\nAssistant:\n")
+    return buf.getvalue()
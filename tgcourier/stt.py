@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import asyncio
+import atexit
 import contextlib
+import functools
 import shutil
 import tempfile
+import uuid
 from pathlib import Path
 
 from .config import Settings
@@ -29,38 +32,52 @@ async def _run(argv: list[str], *, timeout_sec: int) -> tuple[int, str]:
     return int(proc.returncode or 0), out
 
 
+# Containers/codecs the Whisper API takes as-is; anything else gets converted.
+_DIRECT_SUFFIXES = frozenset({".flac", ".m4a", ".mp3", ".mp4", ".mpeg", ".mpga", ".ogg", ".opus", ".wav", ".webm"})
+# Same codec, extension the API doesn't recognize (Telegram voice notes are .oga).
+_REMUX_SUFFIXES = {".oga": ".ogg"}
+# Stay under the API's upload cap; bigger inputs are re-encoded, which shrinks them.
+_DIRECT_MAX_BYTES = 24 * 1024 * 1024
+
+
+@functools.cache
+def _workdir() -> Path:
+    # One scratch dir per process; each call uses its own uniquely named file in it.
+    d = tempfile.mkdtemp(prefix="tg-courier-stt-")
+    atexit.register(shutil.rmtree, d, True)
+    return Path(d)
+
+
 async def transcribe_file(path: Path, *, settings: Settings, logger) -> str:
     if not settings.stt_enabled:
         raise TranscriptionError("STT disabled (STT_ENABLED=0)")
-    if not shutil.which("ffmpeg"):
-        raise TranscriptionError("ffmpeg not found")
     if not shutil.which("llm"):
         raise TranscriptionError("llm not found")
 
-    with tempfile.TemporaryDirectory(prefix="tg-courier-stt-") as td:
-        td_path = Path(td)
-        mp3 = td_path / "audio.mp3"
-
-        code, out = await _run(
-            [
-                "ffmpeg",
-                "-y",
-                "-i",
-                str(path),
-                "-ar",
-                "16000",
-                "-ac",
-                "1",
-                "-c:a",
-                "libmp3lame",
-                "-b:a",
-                "128k",
-                str(mp3),
-            ],
-            timeout_sec=min(settings.stt_timeout_sec, 120),
-        )
-        if code != 0 or not mp3.exists():
-            raise TranscriptionError(f"ffmpeg failed ({code}): {out.strip()[:400]}")
+    tmp: Path | None = None
+    try:
+        suffix = path.suffix.lower()
+        small = path.stat().st_size <= _DIRECT_MAX_BYTES
+
+        if small and suffix in _DIRECT_SUFFIXES:
+            audio = path
+        else:
+            if not shutil.which("ffmpeg"):
+                raise TranscriptionError("ffmpeg not found")
+            if small and suffix in _REMUX_SUFFIXES:
+                # Container rename only: no decode/encode pass.
+                audio = tmp = _workdir() / f"{uuid.uuid4().hex}{_REMUX_SUFFIXES[suffix]}"
+                codec = ["-c:a", "copy"]
+            else:
+                # Whisper works on 16 kHz mono; 32 kbps is plenty for speech.
+                audio = tmp = _workdir() / f"{uuid.uuid4().hex}.mp3"
+                codec = ["-ar", "16000", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "32k"]
+            code, out = await _run(
+                ["ffmpeg", "-y", "-i", str(path), "-vn", *codec, str(audio)],
+                timeout_sec=min(settings.stt_timeout_sec, 120),
+            )
+            if code != 0 or not audio.exists():
+                raise TranscriptionError(f"ffmpeg failed ({code}): {out.strip()[:400]}")
 
         cmd = [
             "llm",
@@ -74,7 +91,7 @@ async def transcribe_file(path: Path, *, settings: Settings, logger) -> str:
             cmd.extend(["--language", settings.stt_language])
         if settings.stt_prompt:
             cmd.extend(["--prompt", settings.stt_prompt])
-        cmd.append(str(mp3))
+        cmd.append(str(audio))
 
         code, out = await _run(cmd, timeout_sec=settings.stt_timeout_sec)
         if code != 0:
@@ -89,6 +106,9 @@ async def transcribe_file(path: Path, *, settings: Settings, logger) -> str:
 
         logger.info("stt ok chars=%s", len(text))
         return text
+    finally:
+        if tmp is not None:
+            cleanup_file(tmp)
 
 
 def cleanup_file(path: Path) -> None:
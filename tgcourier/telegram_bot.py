@@ -2,14 +2,19 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from logging.handlers import MemoryHandler
 import os
 from pathlib import Path
 
-from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+import httpx
+from telegram import Update
+from telegram.ext import AIORateLimiter, Application, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.request import HTTPXRequest
 
 from .agent import build_agent
 from .bg_jobs import BgJobManager
 from .config import load_settings
+from .ctx import HandlerCtx
 from .errors import on_telegram_error
 from .handlers import (
     cmd_cancel,
@@ -26,6 +31,8 @@ from .handlers import (
     cmd_status,
     cmd_w,
     cmd_whoami,
+    dispatch_text,
+    flush_text_batch,
     on_audio,
     on_text,
     on_voice,
@@ -39,13 +46,62 @@ from .handlers_bg import (
     on_bg_callback,
 )
 from .memory import MemoryConfig, MemoryStore
+from .msg_batcher import MessageBatcher
 from .prompts import SYSTEM_PROMPT
 from .queue import QueueManager
-from .state import StateStore
+from .state import open_state_store
 
 
 DEFAULT_LOG_NAME = "tg-courier.log"
 
+COMMANDS = {
+    "help": cmd_help,
+    "whoami": cmd_whoami,
+    "status": cmd_status,
+    "claim": cmd_claim,
+    "reset": cmd_reset,
+    "bg": cmd_bg,
+    "jobs": cmd_jobs,
+    "job": cmd_job,
+    "job_tail": cmd_job_tail,
+    "job_cancel": cmd_job_cancel,
+    "w": cmd_w,
+    "ro": cmd_ro,
+    "sandbox_rw": cmd_sandbox_rw,
+    "sandbox_ro": cmd_sandbox_ro,
+    "queue": cmd_queue,
+    "cancel": cmd_cancel,
+    "drop": cmd_drop,
+    "mem": cmd_mem,
+    "mem_rebuild": cmd_mem_rebuild,
+}
+
+
+async def _dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # One handler + dict lookup instead of a CommandHandler per command. filters.COMMAND
+    # guarantees a leading bot_command entity; parse it the way CommandHandler does.
+    message = update.effective_message
+    name, _, target = message.text[1 : message.entities[0].length].partition("@")
+    if target and target.lower() != (context.bot.username or "").lower():
+        return
+    fn = COMMANDS.get(name.lower())
+    # Texts sent just before a command are queued ahead of it.
+    await flush_text_batch(update, context)
+    if fn is None:
+        return
+    context.args = message.text.split()[1:]
+    await fn(update, context)
+
+
+# Stateless, so built once at import; main() only registers them.
+_HANDLERS = (
+    MessageHandler(filters.COMMAND & filters.UpdateType.MESSAGE, _dispatch_command),
+    CallbackQueryHandler(on_bg_callback, pattern=r"^bg:"),
+    MessageHandler(filters.VOICE, on_voice),
+    MessageHandler(filters.AUDIO | filters.Document.ALL, on_audio),
+    MessageHandler(filters.TEXT & ~filters.COMMAND, on_text),
+)
+
 
 def setup_logging(*, base_dir: Path, log_path: Path | None, echo_local: bool) -> logging.Logger:
     logger = logging.getLogger("tgcourier")
@@ -66,7 +122,8 @@ def setup_logging(*, base_dir: Path, log_path: Path | None, echo_local: bool) ->
     fh = logging.FileHandler(resolved_log_path, encoding="utf-8")
     fh.setLevel(logging.INFO)
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
+    # Buffer file writes: flushed every 64 records, on ERROR, by _flush_logs_every, and at exit.
+    logger.addHandler(MemoryHandler(capacity=64, flushLevel=logging.ERROR, target=fh, flushOnClose=True))
 
     if echo_local:
         sh = logging.StreamHandler()
@@ -78,10 +135,48 @@ def setup_logging(*, base_dir: Path, log_path: Path | None, echo_local: bool) ->
     return logger
 
 
+async def _flush_logs_every(handlers: list[MemoryHandler], interval_sec: float) -> None:
+    while True:
+        await asyncio.sleep(interval_sec)
+        for h in handlers:
+            h.flush()
+
+
+async def _post_init(app: Application) -> None:
+    # Python 3.12+: run new tasks synchronously up to their first suspension point.
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+    buffered = [h for h in logging.getLogger("tgcourier").handlers if isinstance(h, MemoryHandler)]
+    if buffered:
+        app.bot_data["log_flusher"] = asyncio.get_running_loop().create_task(_flush_logs_every(buffered, 1.0))
+
+
+async def _post_stop(app: Application) -> None:
+    # The app no longer runs tasks, so a batch whose timer fires now would be
+    # dispatched nowhere; drop what's left and say so.
+    ctx: HandlerCtx | None = app.bot_data.get("ctx")
+    if ctx:
+        dropped = ctx.batcher.drop_all()
+        if dropped:
+            ctx.logger.warning("shutdown: dropped %d pending text batch(es)", dropped)
+
+
+async def _post_shutdown(app: Application) -> None:
+    flusher: asyncio.Task | None = app.bot_data.pop("log_flusher", None)
+    if flusher:
+        flusher.cancel()
+    ctx: HandlerCtx | None = app.bot_data.get("ctx")
+    if ctx:
+        ctx.store.flush()
+        for h in ctx.logger.handlers:
+            h.flush()
+
+
 def main(*, echo_local: bool = False, log_path: Path | None = None) -> None:
     base_dir = Path(__file__).resolve().parents[1]
     settings = load_settings(base_dir)
-    store = StateStore(settings.state_path)
+    store = open_state_store(settings.state_path)
     agent = build_agent(settings)
     logger = setup_logging(base_dir=base_dir, log_path=log_path, echo_local=echo_local)
     memory = MemoryStore(
@@ -96,8 +191,28 @@ def main(*, echo_local: bool = False, log_path: Path | None = None) -> None:
 
     os.environ.setdefault("PYTHONUNBUFFERED", "1")
 
-    app = Application.builder().token(settings.token).concurrent_updates(True).build()
-    state_lock = asyncio.Lock()
+    # Bot API calls (not getUpdates): keep idle connections for a minute instead of httpx's
+    # 5s default, so replies to sporadic chats reuse a warm TLS connection.
+    api_request = HTTPXRequest(
+        connection_pool_size=64,
+        pool_timeout=5.0,
+        httpx_kwargs={
+            "limits": httpx.Limits(max_connections=64, max_keepalive_connections=64, keepalive_expiry=60.0)
+        },
+    )
+
+    app = (
+        Application.builder()
+        .token(settings.token)
+        .request(api_request)
+        .concurrent_updates(True)
+        # Global + per-group Bot API budget; RetryAfter is retried instead of surfacing.
+        .rate_limiter(AIORateLimiter(max_retries=2))
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
     bg = BgJobManager(
         bot=app.bot,
         base_dir=base_dir,
@@ -109,46 +224,32 @@ def main(*, echo_local: bool = False, log_path: Path | None = None) -> None:
         agent=agent,
         settings=settings,
         store=store,
-        state_lock=state_lock,
         memory=memory,
         bg=bg,
         logger=logger,
         system_prompt=SYSTEM_PROMPT,
     )
+    batcher = MessageBatcher(window_sec=settings.text_batch_ms / 1000, dispatch=dispatch_text)
 
     app.bot_data["settings"] = settings
     app.bot_data["store"] = store
     app.bot_data["agent"] = agent
     app.bot_data["logger"] = logger
     app.bot_data["memory"] = memory
-    app.bot_data["state_lock"] = state_lock
     app.bot_data["queue_manager"] = queue_manager
     app.bot_data["bg_jobs"] = bg
+    app.bot_data["batcher"] = batcher
+    app.bot_data["ctx"] = HandlerCtx(
+        settings=settings,
+        store=store,
+        qm=queue_manager,
+        bg=bg,
+        memory=memory,
+        logger=logger,
+        batcher=batcher,
+    )
 
-    app.add_handler(CommandHandler("help", cmd_help))
-    app.add_handler(CommandHandler("whoami", cmd_whoami))
-    app.add_handler(CommandHandler("status", cmd_status))
-    app.add_handler(CommandHandler("claim", cmd_claim))
-    app.add_handler(CommandHandler("reset", cmd_reset))
-    app.add_handler(CommandHandler("bg", cmd_bg))
-    app.add_handler(CommandHandler("jobs", cmd_jobs))
-    app.add_handler(CommandHandler("job", cmd_job))
-    app.add_handler(CommandHandler("job_tail", cmd_job_tail))
-    app.add_handler(CommandHandler("job_cancel", cmd_job_cancel))
-    app.add_handler(CallbackQueryHandler(on_bg_callback, pattern=r"^bg:"))
-    app.add_handler(CommandHandler("w", cmd_w))
-    app.add_handler(CommandHandler("ro", cmd_ro))
-    app.add_handler(CommandHandler("sandbox_rw", cmd_sandbox_rw))
-    app.add_handler(CommandHandler("sandbox_ro", cmd_sandbox_ro))
-    app.add_handler(CommandHandler("queue", cmd_queue))
-    app.add_handler(CommandHandler("cancel", cmd_cancel))
-    app.add_handler(CommandHandler("drop", cmd_drop))
-    app.add_handler(CommandHandler("mem", cmd_mem))
-    app.add_handler(CommandHandler("mem_rebuild", cmd_mem_rebuild))
-
-    app.add_handler(MessageHandler(filters.VOICE, on_voice))
-    app.add_handler(MessageHandler(filters.AUDIO | filters.Document.ALL, on_audio))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
+    app.add_handlers(_HANDLERS)
 
     app.add_error_handler(on_telegram_error)
     app.run_polling()
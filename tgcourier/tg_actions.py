@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import functools
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from .bg_jobs import BgJobManager
@@ -9,16 +11,22 @@ def build_bg_job_actions(bg: BgJobManager, *, chat_id: int, limit: int = 2) -> I
     active = bg.active_for_chat(chat_id)
     if not active:
         return None
+    return _job_actions_markup(tuple(j.job_id for j in active[: max(1, int(limit))]))
+
 
+# The keyboard is a pure function of the shown job ids and PTB markups are immutable,
+# so the steady-state "same jobs still running" case reuses one object.
+@functools.lru_cache(maxsize=256)
+def _job_actions_markup(job_ids: tuple[int, ...]) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = [
         [InlineKeyboardButton("Jobs", callback_data="bg:jobs")],
     ]
 
-    for j in active[: max(1, int(limit))]:
+    for job_id in job_ids:
         rows.append(
             [
-                InlineKeyboardButton(f"Tail #{j.job_id}", callback_data=f"bg:tail:{j.job_id}"),
-                InlineKeyboardButton(f"Cancel #{j.job_id}", callback_data=f"bg:cancel:{j.job_id}"),
+                InlineKeyboardButton(f"Tail #{job_id}", callback_data=f"bg:tail:{job_id}"),
+                InlineKeyboardButton(f"Cancel #{job_id}", callback_data=f"bg:cancel:{job_id}"),
             ]
         )
 
@@ -1,17 +1,33 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import shutil
 import time
 from urllib.parse import urlparse
 
 from .config import Settings
 
 
+_BACKOFF_START_SEC = 2.0
+_BACKOFF_MAX_SEC = 8.0
+
+
+@functools.lru_cache(maxsize=32)
+def _resolve_exe(name: str) -> str:
+    return shutil.which(name) or name
+
+
 async def run_cmd(argv: list[str], *, timeout_sec: int = 30) -> tuple[int, str]:
+    # An absolute executable plus close_fds=False lets subprocess use posix_spawn
+    # (vfork-style on glibc, a syscall on macOS) instead of forking the interpreter.
+    # Python's own fds are non-inheritable (PEP 446), so nothing extra leaks.
     proc = await asyncio.create_subprocess_exec(
-        *argv,
+        _resolve_exe(argv[0]),
+        *argv[1:],
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.STDOUT,
+        close_fds=False,
     )
     try:
         out_b, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout_sec)
@@ -39,27 +55,36 @@ async def oauth_peekaboo_flow(*, url: str, settings: Settings, logger) -> None:
     if settings.oauth_auto_allow:
         click_labels.append("Allow")
 
-    start = time.time()
-    while time.time() - start < 180:
-        progressed = False
+    def click(label: str):
+        return run_cmd(
+            [
+                "peekaboo",
+                "click",
+                label,
+                "--app",
+                browser,
+                "--wait-for",
+                "5000",
+                "--space-switch",
+            ],
+            timeout_sec=12,
+        )
+
+    # Labels are tried in order, one click per round (they're steps of the same
+    # flow); back off while nothing is clickable, snap back on progress.
+    delay = _BACKOFF_START_SEC
+    deadline = time.monotonic() + 180
+    while time.monotonic() < deadline:
+        clicked = None
         for label in click_labels:
-            code, _out = await run_cmd(
-                [
-                    "peekaboo",
-                    "click",
-                    label,
-                    "--app",
-                    browser,
-                    "--wait-for",
-                    "5000",
-                    "--space-switch",
-                ],
-                timeout_sec=12,
-            )
+            code, _out = await click(label)
             if code == 0:
-                logger.info("oauth peekaboo clicked=%s", label)
-                progressed = True
-                await asyncio.sleep(1.0)
-        if not progressed:
-            await asyncio.sleep(2.0)
-
+                clicked = label
+                break
+        if clicked:
+            logger.info("oauth peekaboo clicked=%s", clicked)
+            delay = _BACKOFF_START_SEC
+            await asyncio.sleep(1.0)
+        else:
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, _BACKOFF_MAX_SEC)
@@ -1,146 +1,154 @@
 from __future__ import annotations
 
+from collections.abc import Awaitable, Callable
+import functools
 import html
+import re
 
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 
 
-def chunk(text: str, limit: int = 3900) -> list[str]:
+# Markup tokens in one pass: fence, inline code, bold, or a whole [label](http(s)://url) link.
+# The label runs to the first "](" and the url to the first ")". Both are capped (possessively,
+# so no backtracking) so prose full of "[1]"-style brackets doesn't rescan to the end per "[".
+_MD_RE = re.compile(r"```|`|\*\*|\[((?:[^\]]|\](?!\()){0,512}+)\]\((https?://[^)]{0,2048}+)\)")
+
+# Renderer state: at most one of these is set, since opening code/pre closes bold first.
+_BOLD, _CODE, _PRE = 1, 2, 4
+_VERBATIM = _CODE | _PRE
+_CLOSE_TAGS = {0: "", _BOLD: "</b>", _CODE: "</code>", _PRE: "</code></pre>"}
+
+
+CHUNK_LIMIT = 3900
+
+
+def chunk(text: str, limit: int = CHUNK_LIMIT) -> list[str]:
     text = (text or "").strip()
     if not text:
         return ["(empty)"]
     if len(text) <= limit:
         return [text]
 
+    # Walk a cursor over `text` instead of reslicing the remainder each round.
     chunks: list[str] = []
-    remaining = text
-    while remaining:
-        if len(remaining) <= limit:
-            chunks.append(remaining)
+    pos = 0
+    n = len(text)
+    while pos < n:
+        end = pos + limit
+        if end >= n:
+            chunks.append(text[pos:])
             break
-        cut = remaining.rfind("\n", 0, limit)
-        if cut < limit * 0.6:
-            cut = limit
-        chunk_s = remaining[:cut].rstrip()
-        chunks.append(chunk_s or remaining[:limit])
-        remaining = remaining[cut:].lstrip()
+        cut = text.rfind("\n", pos, end)
+        if cut - pos < limit * 0.6:
+            cut = end
+        chunks.append(text[pos:cut].rstrip() or text[pos:end])
+        pos = cut
+        while pos < n and text[pos].isspace():
+            pos += 1
     return chunks
 
 
+# Pure function of the text; canned replies (/help, /status, acks) repeat verbatim.
+@functools.lru_cache(maxsize=512)
 def render_telegram_html(text: str) -> str:
     s = text or ""
+    if "`" not in s and "*" not in s and "[" not in s:
+        # Plain text (status pings, acks): nothing can open markup, so escape and return.
+        return html.escape(s)
     out: list[str] = []
-    bold = False
-    code = False
-    pre = False
+    state = 0
     i = 0
 
-    def close_all() -> None:
-        nonlocal bold, code, pre
-        if code:
-            out.append("</code>")
-            code = False
-        if pre:
-            out.append("</code></pre>")
-            pre = False
-        if bold:
-            out.append("</b>")
-            bold = False
-
-    while i < len(s):
-        if not code and s.startswith("```", i):
-            if pre:
-                out.append("</code></pre>")
-                pre = False
+    while True:
+        m = _MD_RE.search(s, i)
+        if m is None:
+            out.append(html.escape(s[i:]))
+            break
+        start = m.start()
+        if start > i:
+            out.append(html.escape(s[i:start]))
+        tok = m.group(0)
+
+        if tok == "```" and state != _CODE:
+            if state == _PRE:
+                out.append(_CLOSE_TAGS[_PRE])
+                state = 0
             else:
-                if bold:
-                    out.append("</b>")
-                    bold = False
-                out.append("<pre><code>")
-                pre = True
-            i += 3
+                out.append(_CLOSE_TAGS[state] + "<pre><code>")
+                state = _PRE
+            i = m.end()
             continue
 
-        if not pre and s[i] == "`":
-            if code:
-                out.append("</code>")
-                code = False
+        if tok[0] == "`":
+            # Inside code a fence is just the closing backtick; the rest is rescanned.
+            i = start + 1
+            if state == _PRE:
+                out.append("`")
+            elif state == _CODE:
+                out.append(_CLOSE_TAGS[_CODE])
+                state = 0
             else:
-                if bold:
-                    out.append("</b>")
-                    bold = False
-                out.append("<code>")
-                code = True
-            i += 1
+                out.append(_CLOSE_TAGS[state] + "<code>")
+                state = _CODE
             continue
 
-        if not (code or pre) and s.startswith("**", i):
-            if bold:
-                out.append("</b>")
-                bold = False
+        if state & _VERBATIM:
+            # Markup is literal here; a link match may span a closing backtick, so rescan after "[".
+            if tok == "**":
+                out.append(tok)
+                i = m.end()
             else:
-                out.append("<b>")
-                bold = True
-            i += 2
+                out.append("[")
+                i = start + 1
             continue
 
-        if not (code or pre) and s[i] == "[":
-            j = s.find("](", i)
-            if j != -1:
-                k = s.find(")", j + 2)
-                if k != -1:
-                    label = s[i + 1 : j]
-                    url = s[j + 2 : k]
-                    if url.startswith("http://") or url.startswith("https://"):
-                        out.append(
-                            f'<a href="{html.escape(url, quote=True)}">{html.escape(label)}</a>'
-                        )
-                        i = k + 1
-                        continue
-
-        out.append(html.escape(s[i]))
-        i += 1
-
-    close_all()
+        if tok == "**":
+            out.append("</b>" if state else "<b>")
+            state ^= _BOLD
+        else:
+            label, url = m.group(1), m.group(2)
+            out.append(f'<a href="{html.escape(url, quote=True)}">{html.escape(label)}</a>')
+        i = m.end()
+
+    out.append(_CLOSE_TAGS[state])
     return "".join(out)
 
 
-async def send_chat(bot, chat_id: int, text: str, *, reply_markup=None) -> None:
-    chunks = chunk(text)
+# bot.send_message bound to a chat, or Chat.send_message; called with keyword args only.
+_Send = Callable[..., Awaitable[object]]
+
+_HTML_SEND_KWARGS: dict[str, object] = {"parse_mode": ParseMode.HTML, "disable_web_page_preview": True}
+_PLAIN_SEND_KWARGS: dict[str, object] = {"disable_web_page_preview": True}
+
+
+async def _send_chunk(send: _Send, raw: str, html_text: str, *, reply_markup=None) -> None:
+    try:
+        await send(text=html_text, reply_markup=reply_markup, **_HTML_SEND_KWARGS)
+    except BadRequest:
+        await send(text=raw, reply_markup=reply_markup, **_PLAIN_SEND_KWARGS)
+
+
+async def _send_text(send: _Send, text: str, reply_markup) -> None:
+    t = (text or "").strip()
+    if len(t) <= CHUNK_LIMIT:
+        # Nearly every reply fits one message: skip chunk() and the loop.
+        t = t or "(empty)"
+        await _send_chunk(send, t, render_telegram_html(t), reply_markup=reply_markup)
+        return
+
+    chunks = chunk(t)
+    rendered = [render_telegram_html(c) for c in chunks]
+    last = len(chunks) - 1
     for i, c in enumerate(chunks):
-        try:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=render_telegram_html(c),
-                parse_mode=ParseMode.HTML,
-                disable_web_page_preview=True,
-                reply_markup=reply_markup if i == len(chunks) - 1 else None,
-            )
-        except BadRequest:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=c,
-                disable_web_page_preview=True,
-                reply_markup=reply_markup if i == len(chunks) - 1 else None,
-            )
+        await _send_chunk(send, c, rendered[i], reply_markup=reply_markup if i == last else None)
+
+
+async def send_chat(bot, chat_id: int, text: str, *, reply_markup=None) -> None:
+    await _send_text(functools.partial(bot.send_message, chat_id=chat_id), text, reply_markup)
 
 
 async def send_update(update, text: str, *, reply_markup=None) -> None:
     if not update.effective_chat:
         return
-    chunks = chunk(text)
-    for i, c in enumerate(chunks):
-        try:
-            await update.effective_chat.send_message(
-                render_telegram_html(c),
-                parse_mode=ParseMode.HTML,
-                disable_web_page_preview=True,
-                reply_markup=reply_markup if i == len(chunks) - 1 else None,
-            )
-        except BadRequest:
-            await update.effective_chat.send_message(
-                c,
-                disable_web_page_preview=True,
-                reply_markup=reply_markup if i == len(chunks) - 1 else None,
-            )
+    await _send_text(update.effective_chat.send_message, text, reply_markup)
@@ -1,6 +1,17 @@
 from __future__ import annotations
 
-import json
+import re
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+
+# The marker must sit alone on its line (surrounding whitespace allowed); the spec is the
+# next non-blank line. Both are found on the original string, so nothing is split or joined.
+_DETACH_LINE_RE = re.compile(r"^[^\S\n]*TG_COURIER_TOOL: DETACH[^\S\n]*$", re.IGNORECASE | re.MULTILINE)
+_NONBLANK_LINE_RE = re.compile(r"^[^\n]*\S[^\n]*$", re.MULTILINE)
 
 
 def extract_detach_directive(text: str) -> tuple[dict[str, object] | None, str]:
@@ -12,28 +23,17 @@ def extract_detach_directive(text: str) -> tuple[dict[str, object] | None, str]:
     Returns (spec, cleaned_text).
     """
     raw = text or ""
-    lines = raw.splitlines()
-    cleaned: list[str] = []
-
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.upper() == "TG_COURIER_TOOL: DETACH":
-            j = i + 1
-            while j < len(lines) and not lines[j].strip():
-                j += 1
-            if j >= len(lines):
-                return None, raw
-            try:
-                spec = json.loads(lines[j])
-            except Exception:
-                return None, raw
-            if not isinstance(spec, dict):
-                return None, raw
-            cleaned.extend(lines[:i])
-            cleaned.extend(lines[j + 1 :])
-            return spec, "\n".join(cleaned).strip()
-        i += 1
-
-    return None, raw.strip()
+    marker = _DETACH_LINE_RE.search(raw)
+    if marker is None:
+        return None, raw.strip()
 
+    spec_line = _NONBLANK_LINE_RE.search(raw, marker.end() + 1)
+    if spec_line is None:
+        return None, raw
+    try:
+        spec = _json_loads(spec_line.group(0))
+    except Exception:
+        return None, raw
+    if not isinstance(spec, dict):
+        return None, raw
+    return spec, (raw[: marker.start()] + raw[spec_line.end() + 1 :]).strip()